@@ -4,47 +4,52 @@ import json
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 # We need to import the core LangGraph setup functions or the graph itself
 # Assuming 'makegraph' from basic_nodes_bot.py correctly sets up the graph
-from basic_nodes_bot import makegraph, insert_orders_from_bot
+from basic_nodes_bot import makegraph, insert_orders_from_bot, resources
+from profiler import default_profiler
 from Classes import Item, Order # Assuming Item class is defined in Classes.py
-from inventory_depletion import deplete_inventory_from_order
+from inventory_depletion import deplete_inventory_from_order, reserve_stock
 from db_utils import get_available_menu_meals, get_unavailable_meals # Import for displaying menu after order
-from dotenv import load_dotenv
+from db_pool import connection
+from async_runtime import run, collect
 import os
-load_dotenv("keys.env")
-# --- IMPORTANT: MySQL DB_CONFIG for Streamlit App ---
-# Ensure these details match your 'restaurant_new_db' setup
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',        # Your MySQL username
-    'password': '12345678', # Your MySQL password
-    'database': os.getenv('DB_NAME') # The database where 'Orders' table is
-}
-# ----------------------------------------------------
+
+# PROFILE_NODES=1 wraps every graph node with the profiler and shows the latency panel in the sidebar
+PROFILE_NODES = os.getenv("PROFILE_NODES", "0").lower() in {"1", "true", "yes", "on"}
+# ASYNC_GRAPH=1 builds the async graph and runs every session's turns on one shared event loop
+ASYNC_GRAPH = os.getenv("ASYNC_GRAPH", "0").lower() in {"1", "true", "yes", "on"}
+# SPECULATE=1 runs order extraction alongside the router LLM call (cost guard: SPECULATE_MIN_HIT_RATE, SPECULATE_MAX_CHARS)
+SPECULATE = os.getenv("SPECULATE", "0").lower() in {"1", "true", "yes", "on"}
+# COMBINED_ROUTER=1 routes and extracts orders with one LLM call (promptstore.routedOrderPrompt)
+COMBINED_ROUTER = os.getenv("COMBINED_ROUTER", "0").lower() in {"1", "true", "yes", "on"}
 
 # Streamlit Page Config
 st.set_page_config(page_title="Menu Order Chatbot", page_icon="🍽️", layout="centered")
 st.title("🍽️ Restaurant Order Assistant")
 st.caption("Ask questions about the menu or place an order.")
 
-def get_item_price_from_db(item_name: str, conn):
+def get_item_price_from_db(item_name: str):
     """
-    Fetches the price of an item from the 'Meals' table in the database.
-    Assumes 'Meals' table has 'item_name' and 'price' columns.
+    Fetches the price of an item, from the shared menu index when it knows the item,
+    otherwise from the 'Meals' table in the database (pooled connection).
     """
-    if conn is None:
-        return None # Cannot get price without connection
-    try:
-        cursor = conn.cursor()
-        query = "SELECT price FROM Meals WHERE name = %s"
-        cursor.execute(query, (item_name,))
-        result = cursor.fetchone()
-        cursor.close()
-        if result:
-            return float(result[0])
-        return None
-    except mysql.connector.Error as err:
-        st.error(f"Error fetching price for {item_name}: {err}")
-        return None
+    price = resources.get("menu_index").price(item_name)
+    if price is not None:
+        return float(price)
+    with connection() as conn:
+        if conn is None:
+            return None # Cannot get price without connection
+        try:
+            cursor = conn.cursor()
+            query = "SELECT price FROM Meals WHERE name = %s"
+            cursor.execute(query, (item_name,))
+            result = cursor.fetchone()
+            cursor.close()
+            if result:
+                return float(result[0])
+            return None
+        except mysql.connector.Error as err:
+            st.error(f"Error fetching price for {item_name}: {err}")
+            return None
 
 def display_updated_menu_for_streamlit(current_mysql_conn):
     """
@@ -52,8 +57,9 @@ def display_updated_menu_for_streamlit(current_mysql_conn):
     including newly unavailable items.
     """
     if current_mysql_conn and current_mysql_conn.is_connected():
-        available_meals = get_available_menu_meals(current_mysql_conn)
-        unavailable_meals = get_unavailable_meals(current_mysql_conn)
+        availability = resources.get("availability")
+        available_meals = get_available_menu_meals(current_mysql_conn, availability)
+        unavailable_meals = get_unavailable_meals(current_mysql_conn, availability)
 
         menu_display_str = ""
         if available_meals:
@@ -88,19 +94,20 @@ def initialize_session_state():
         st.session_state.cart = [] # This will store Item objects
     if "rejected_items" not in st.session_state:
         st.session_state.rejected_items = [] # This will store dicts for rejected items
-    if "mysql_conn" not in st.session_state:
-        try:
-            st.session_state.mysql_conn = mysql.connector.connect(**DB_CONFIG)
+    if "db_available" not in st.session_state:
+        # Connections are checked out of the shared pool per operation; this only checks MySQL is reachable
+        with connection() as conn:
+            st.session_state.db_available = conn is not None
+        if st.session_state.db_available:
             st.success("✅ MySQL connection established!")
-        except mysql.connector.Error as err:
-            st.error(f"❌ Error connecting to MySQL: {err}. Order saving and price display will not work.")
-            st.session_state.mysql_conn = None
+        else:
+            st.error("❌ Error connecting to MySQL. Order saving and price display will not work.")
 
     # Initialize LangGraph graph
     if "graph" not in st.session_state:
-        if st.session_state.mysql_conn:
+        if st.session_state.db_available:
             # makegraph is expected to return the compiled LangGraph object
-            st.session_state.graph = makegraph()
+            st.session_state.graph = makegraph(profile=default_profiler if PROFILE_NODES else None, use_async=ASYNC_GRAPH, speculative=SPECULATE, combined_router=COMBINED_ROUTER)
             st.session_state.thread_id = "streamlit_user_thread" # A fixed thread ID for the Streamlit user
             st.session_state.config = {"configurable": {"thread_id": st.session_state.thread_id}}
             
@@ -137,14 +144,18 @@ def process_message(user_input: str):
     # --- Handle checkout logic with detailed feedback ---
     if user_input.lower().strip() in {"checkout", "confirm", "yes", "y"}:
         if st.session_state.cart:
-            if st.session_state.mysql_conn:
-                order_process_result = insert_orders_from_bot(st.session_state.cart, st.session_state.mysql_conn, deplete_inventory_from_order)
+            if st.session_state.db_available:
+                with connection() as conn:
+                    order_process_result = insert_orders_from_bot(st.session_state.cart, conn, deplete_inventory_from_order, resources.get("menu_index"), resources.get("availability"), reserve_stock_func=reserve_stock)
                 
                 if order_process_result and order_process_result["success"]:
                     confirmation_message = "Order confirmed and will be sent to the Kitchen! Thank you."
-                    if order_process_result["unavailable_meals"]:
+                    if order_process_result.get("unavailable_meals", []):
                         unavailable_names = ", ".join([m['meal_name'] for m in order_process_result["unavailable_meals"]])
                         confirmation_message += f"\nNote: The following meals are now unavailable due to ingredient shortages: {unavailable_names}."
+                    if order_process_result.get("rejected_items"):
+                        rejected_names = ", ".join(f"{r['quantity']} x {r['item_name']}" for r in order_process_result["rejected_items"])
+                        confirmation_message += f"\nSorry, we ran out of stock for: {rejected_names}. These were not included in your order."
                     
                     ai_messages_for_display.append(AIMessage(content=confirmation_message))
                     full_response_content += confirmation_message + "\n"
@@ -161,7 +172,8 @@ def process_message(user_input: str):
                     })
                     
                     # Immediately display the updated menu
-                    menu_str = display_updated_menu_for_streamlit(st.session_state.mysql_conn)
+                    with connection() as conn:
+                        menu_str = display_updated_menu_for_streamlit(conn)
                     ai_messages_for_display.append(AIMessage(content=menu_str))
                     full_response_content += menu_str + "\n"
 
@@ -181,7 +193,12 @@ def process_message(user_input: str):
 
     # --- Stream updates from the graph for non-checkout inputs ---
     # The graph expects the full message history in the input `messages`
-    for update in st.session_state.graph.stream({"messages": updated_graph_messages}, config=st.session_state.config):
+    graph_input = {"messages": updated_graph_messages}
+    if ASYNC_GRAPH:
+        updates = run(collect(st.session_state.graph.astream(graph_input, config=st.session_state.config)))
+    else:
+        updates = st.session_state.graph.stream(graph_input, config=st.session_state.config)
+    for update in updates:
         for step, output in update.items():
             if "messages" in output:
                 for m in output["messages"]:
@@ -221,7 +238,7 @@ def display_order_summary():
             modifiers = item.modifiers if hasattr(item, 'modifiers') and item.modifiers else []
             mod_text = f" ({', '.join(modifiers)})" if modifiers else ""
 
-            item_price = get_item_price_from_db(name, st.session_state.mysql_conn)
+            item_price = get_item_price_from_db(name)
             if item_price is not None:
                 item_total = item_price * qty
                 total_order_price += item_total
@@ -279,6 +296,40 @@ def display_order_summary():
         st.sidebar.info("No items in your cart yet.")
 
 
+def display_profiler_panel():
+    """Rolling per-node latency (p50/p95/p99), tokens, DB round trips and embedding calls."""
+    stats = default_profiler.stats()
+    with st.sidebar.expander("⏱️ Node latency", expanded=False):
+        if not stats:
+            st.caption("No profiled turns yet.")
+            return
+        rows = [
+            {
+                "node": node,
+                "calls": s["calls"],
+                "p50 ms": round(s["p50_ms"], 1),
+                "p95 ms": round(s["p95_ms"], 1),
+                "p99 ms": round(s["p99_ms"], 1),
+                "tokens/call": round(s["tokens"], 1),
+                "DB trips/call": round(s["db_round_trips"], 2),
+                "embeds/call": round(s["embedding_calls"], 2),
+            }
+            for node, s in sorted(stats.items(), key=lambda kv: -kv[1]["p95_ms"])
+        ]
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+        startup = resources.timings()
+        if startup:
+            st.caption("Startup (seconds since import / build time)")
+            st.dataframe(
+                [{"resource": name, "started": round(t["started_at"], 2), "seconds": round(t["seconds"], 2)}
+                 for name, t in sorted(startup.items(), key=lambda kv: kv[1]["started_at"])],
+                hide_index=True, use_container_width=True,
+            )
+        if st.button("Reset profiler", use_container_width=True):
+            default_profiler.reset()
+            st.rerun()
+
+
 def main():
     initialize_session_state()
 
@@ -304,6 +355,10 @@ def main():
         st.markdown("---")
         display_order_summary()
 
+        if PROFILE_NODES:
+            st.markdown("---")
+            display_profiler_panel()
+
         st.markdown("---")
         st.markdown("### 💡 Sample Orders")
         sample_orders = [ "What paneer items do you have?", " What are the Beverages you offer? ", "I want a large pizza", "Two burgers and a coke", "I want to checkout"]
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 import pandas as pd
 from typing import Annotated
@@ -16,6 +16,11 @@ class Order(BaseModel):
     delete: List[Item]
     modify: List[Item]
 
+class RoutedOrder(BaseModel):
+    """Single-call router + extractor output: the route, and the order when the route is "extract"."""
+    intent: Literal["extract", "conversation"]
+    order: Optional[Order] = None
+
 class OrderUpdate(BaseModel):
     def count_ordered_items(self, order: Order, menu: pd.DataFrame) -> pd.DataFrame:
         """
@@ -5,13 +5,9 @@ import os
 import re
 from datetime import datetime
 import time 
+from db_pool import get_connection
 
-# --- IMPORTANT: Configure your MySQL connection details here ---
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',        # Your MySQL username
-    'password': '12345678', # Your MySQL password
-}
+# MySQL host/user/password come from the shared pool configuration in db_pool.py
 NEW_DB_NAME = 'restaurant_new_db'
 # -------------------------------------------------------------
 
@@ -149,18 +145,10 @@ class Item:
         self.modifiers = modifiers if modifiers is not None else []
 
 def get_mysql_connection(database_name=None):
-    """Establishes and returns a connection to the MySQL server or a specific database."""
-    config = DB_CONFIG.copy()
+    """Checks out a pooled connection to the MySQL server (no database) or to a specific database."""
     if database_name:
-        config['database'] = database_name
-    
-    try:
-        conn = mysql.connector.connect(**config)
-        return conn
-    except mysql.connector.Error as err:
-        print(f"Error connecting to MySQL: {err}")
-        print("Please ensure your MySQL server is running and connection details are correct.")
-        return None
+        return get_connection(database=database_name)
+    return get_connection(server_only=True)
 
 def create_database_if_not_exists(conn, db_name):
     """Creates the specified database if it does not already exist."""
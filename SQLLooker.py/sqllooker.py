@@ -1,28 +1,9 @@
 import mysql.connector
-from dotenv import load_dotenv
-import os
-load_dotenv("keys.env")
-
-# --- IMPORTANT: Configure your MySQL connection details here ---
-# Replace with your actual MySQL username, password, and database name.
-# These details must match what you used to set up 'restaurant_new_db'
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root', # Your MySQL username
-    'password': '12345678', # Your MySQL password
-    'database': os.getenv('DB_NAME') # The name of the database created by the Canvas
-}
-# -------------------------------------------------------------
+from db_pool import get_connection
 
 def get_mysql_connection():
-    """Establishes and returns a connection to the MySQL database using DB_CONFIG."""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except mysql.connector.Error as err:
-        print(f"Error connecting to MySQL: {err}")
-        print("Please ensure your MySQL server is running and connection details are correct.")
-        return None
+    """Checks out a connection from the shared MySQL pool (configured in db_pool)."""
+    return get_connection()
 
 def display_table_contents(conn, table_name):
     """
@@ -74,6 +55,6 @@ if __name__ == '__main__':
             display_table_contents(conn, 'Recipe_Ingredients')
         finally:
             conn.close()
-            print("\nMySQL connection is closed.")
+            print("\nMySQL connection returned to the pool.")
     else:
         print("Could not establish a database connection.")
@@ -0,0 +1,33 @@
+import asyncio
+import threading
+
+# One event loop on a daemon thread, shared by every caller in the process. Sync front ends
+# (Streamlit reruns, the CLI) submit coroutines with run(); while a conversation waits on the
+# LLM its coroutine is parked on the loop, so concurrent sessions don't each hold a thread.
+
+_loop = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-runtime", daemon=True).start()
+        return _loop
+
+
+def submit(coro):
+    """Schedule coro on the shared loop; returns a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout=None):
+    """Run coro on the shared loop and block the calling (non-loop) thread for its result."""
+    return submit(coro).result(timeout)
+
+
+async def collect(agen):
+    """Drain an async iterator (e.g. graph.astream(...)) into a list."""
+    return [item async for item in agen]
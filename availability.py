@@ -0,0 +1,198 @@
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+import mysql.connector
+
+from instrumentation import logger
+
+
+def _num(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+
+class AvailabilityEngine:
+    """
+    In-memory, incrementally maintained meal availability.
+
+    Keeps each meal's recipe, an ingredient -> meals reverse index and, per meal, the number of
+    ingredients currently below the recipe requirement ("short count"). Depleting or restocking an
+    ingredient only re-checks the meals that use it, so availability reads are O(1) and checkout
+    no longer needs the full Meals x Recipe_Ingredients x Ingredients scan in db_utils.
+    Same rule as get_unavailable_meals: a meal is unavailable if any ingredient's inventory is
+    NULL or below the required quantity.
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age          # seconds before ensure_fresh() reloads from MySQL
+        self.meal_names = {}            # meal_id -> name
+        self.recipes = {}               # meal_id -> {ingredient_id: required quantity}
+        self.meals_using = defaultdict(set)  # ingredient_id -> {meal_id}
+        self.ingredients = {}           # ingredient_id -> {"name", "unit"}
+        self.inventory = {}             # ingredient_id -> current inventory (None if NULL)
+        self.short_count = {}           # meal_id -> number of short ingredients
+        self.unavailable = set()        # meal_ids with short_count > 0
+        self.version = 0
+        self.loaded_at = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_db(cls, conn, **kwargs):
+        engine = cls(**kwargs)
+        engine.reload(conn)
+        return engine
+
+    @classmethod
+    def from_artifact(cls, artifact, conn, **kwargs):
+        """
+        Recipes from a compiled menu artifact (menu_artifact.py), inventory from MySQL in one
+        narrow query. If the recipe tables changed since the artifact was compiled, or later
+        (ensure_fresh), recipes come from the full reload() instead.
+        """
+        engine = cls(**kwargs)
+        if conn is None:
+            return engine
+        if not artifact.recipes_current(conn):
+            logger.warning("Menu artifact recipes are stale; loading recipes from MySQL (run `python menu_artifact.py compile`)")
+            engine.reload(conn)
+            return engine
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT ingredient_id, current_inventory FROM Ingredients;")
+                inventory = dict(cursor.fetchall())
+        except mysql.connector.Error as err:
+            logger.error("Error loading availability data: %s", err)
+            return engine
+        meals, recipe_rows = artifact.recipe_rows()
+        for row in recipe_rows:
+            row["current_inventory"] = inventory.get(row["ingredient_id"])
+        engine.load(meals, recipe_rows)
+        return engine
+
+    def reload(self, conn):
+        """Rebuild everything from MySQL (two queries). Returns False if the DB could not be read."""
+        if conn is None:
+            return False
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                cursor.execute("SELECT meal_id, name AS meal_name FROM Meals;")
+                meals = cursor.fetchall()
+                cursor.execute("""
+                    SELECT
+                        ri.Meal_ID AS meal_id,
+                        i.ingredient_id,
+                        ri.quantity AS required_quantity,
+                        i.ingredient_name,
+                        i.current_inventory,
+                        i.unit
+                    FROM Recipe_Ingredients ri
+                    JOIN Ingredients i ON ri.Ingredient_ID = i.ingredient_id
+                """)
+                recipe_rows = cursor.fetchall()
+        except mysql.connector.Error as err:
+            logger.error("Error loading availability data: %s", err)
+            return False
+        self.load(meals, recipe_rows)
+        return True
+
+    def load(self, meals, recipe_rows):
+        """Build the indexes from Meals rows and recipe rows (meal_id, ingredient_id, required_quantity, ...)."""
+        with self._lock:
+            self.meal_names = {m["meal_id"]: m["meal_name"] for m in meals}
+            self.recipes = defaultdict(dict)
+            self.meals_using = defaultdict(set)
+            self.ingredients, self.inventory = {}, {}
+            for row in recipe_rows:
+                meal_id, ing_id = row["meal_id"], row["ingredient_id"]
+                self.recipes[meal_id][ing_id] = self.recipes[meal_id].get(ing_id, 0) + _num(row["required_quantity"])
+                self.meals_using[ing_id].add(meal_id)
+                self.ingredients[ing_id] = {"name": row["ingredient_name"], "unit": row["unit"]}
+                self.inventory[ing_id] = _num(row["current_inventory"])
+
+            self.short_count = {
+                meal_id: sum(self._is_short(ing_id, qty) for ing_id, qty in recipe.items())
+                for meal_id, recipe in self.recipes.items()
+            }
+            self._set_unavailable({m for m, n in self.short_count.items() if n > 0}, force=True)
+            self.loaded_at = time.monotonic()
+
+    def is_fresh(self):
+        """Loaded and younger than max_age, i.e. ensure_fresh() would not reload."""
+        return self.loaded_at is not None and (self.max_age is None or time.monotonic() - self.loaded_at <= self.max_age)
+
+    def ensure_fresh(self, conn):
+        """Reload from MySQL if never loaded or older than max_age (inventory may change outside the bot)."""
+        if not self.is_fresh():
+            self.reload(conn)
+
+    def _is_short(self, ing_id, required):
+        inventory = self.inventory.get(ing_id)
+        return inventory is None or inventory < required
+
+    def _set_unavailable(self, unavailable, force=False):
+        if force or unavailable != self.unavailable:
+            self.unavailable = unavailable
+            self.version += 1
+
+    def set_inventory(self, updates):
+        """Apply absolute inventory values {ingredient_id: qty}; only meals using those ingredients are re-checked."""
+        with self._lock:
+            unavailable = set(self.unavailable)
+            for ing_id, new_qty in updates.items():
+                new_qty = _num(new_qty)
+                for meal_id in self.meals_using.get(ing_id, ()):
+                    required = self.recipes[meal_id][ing_id]
+                    was_short = self._is_short(ing_id, required)
+                    now_short = new_qty is None or new_qty < required
+                    if was_short != now_short:
+                        self.short_count[meal_id] += 1 if now_short else -1
+                        if self.short_count[meal_id] > 0:
+                            unavailable.add(meal_id)
+                        else:
+                            unavailable.discard(meal_id)
+                self.inventory[ing_id] = new_qty
+            self._set_unavailable(unavailable)
+
+    def apply_depletion(self, deltas):
+        """Subtract {ingredient_id: amount} (NULL inventory counts as 0, like the depletion code)."""
+        with self._lock:
+            self.set_inventory({ing_id: (self.inventory.get(ing_id) or 0) - amount for ing_id, amount in deltas.items()})
+
+    def restock(self, ing_id, amount):
+        with self._lock:
+            self.set_inventory({ing_id: (self.inventory.get(ing_id) or 0) + amount})
+
+    def deplete_order(self, lines):
+        """Mirror a checkout in memory: lines are (meal_id, quantity)."""
+        deltas = defaultdict(float)
+        for meal_id, quantity in lines:
+            for ing_id, required in self.recipes.get(meal_id, {}).items():
+                deltas[ing_id] += quantity * required
+        self.apply_depletion(deltas)
+
+    def is_available(self, meal_id):
+        return meal_id not in self.unavailable
+
+    def available_meals(self):
+        """Same shape as db_utils.get_available_menu_meals: [{'meal_id', 'meal_name'}]."""
+        with self._lock:
+            return [{"meal_id": m, "meal_name": name} for m, name in self.meal_names.items() if m not in self.unavailable]
+
+    def unavailable_meals(self):
+        """Same shape as db_utils.get_unavailable_meals; missing ingredients are computed for short meals only."""
+        with self._lock:
+            result = []
+            for meal_id in self.meal_names:
+                if meal_id not in self.unavailable:
+                    continue
+                missing = []
+                for ing_id, required in self.recipes[meal_id].items():
+                    if self._is_short(ing_id, required):
+                        missing.append({
+                            "ingredient_name": self.ingredients[ing_id]["name"],
+                            "needed": required - (self.inventory.get(ing_id) or 0),
+                            "unit": self.ingredients[ing_id]["unit"],
+                        })
+                result.append({"meal_name": self.meal_names[meal_id], "missing_ingredients": missing})
+            return result
@@ -12,93 +12,210 @@ from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 from langgraph.checkpoint.memory import MemorySaver
 
-#from rank_bm25 import BM25Okapi
-from searchers import MultiSearch
-from langchain_community.vectorstores import FAISS 
-from langchain_huggingface import HuggingFaceEmbeddings
+from searchers import MultiSearch, BM25Index, faiss_relevance_to_cosine
+from menu_index import MenuIndex, load_aliases
+from intent import IntentClassifier
+from order_parser import OrderParser
+from embedding_cache import CachedEmbeddings
+from caching import LRUCache
+from availability import AvailabilityEngine
+from profiler import default_profiler
+from startup import Resources
+from speculation import SpeculationGuard
+from menu_artifact import load_artifact, MENU_PATH
 
-from promptstore import orderPrompt, conversationPrompt, routerPrompt
-from Classes import Item, Order, State
+from promptstore import orderPrompt, conversationPrompt, routerPrompt, routedOrderPrompt
+from Classes import Item, Order, RoutedOrder, State
 from utils import makeRetriever
 from db_utils import get_ingredient_current_inventory, insert_orders_from_bot
-from inventory_depletion import deplete_inventory_from_order
-from nodes import router_node, extract_order_node, routeFunc, processOrder, menu_query_node, summary_node, confirm_order, clarify_options_node, deleteOrder, display_rejected, checkRejected, modifyOrder
+from inventory_depletion import deplete_inventory_from_order, reserve_stock
+from nodes import router_node, extract_order_node, arouter_node, aextract_order_node, speculative_router_node, aspeculative_router_node, routed_order_node, arouted_order_node, offload, routeFunc, processOrder, menu_query_node, summary_node, confirm_order, clarify_options_node, deleteOrder, display_rejected, checkRejected, modifyOrder
 
-import mysql.connector
+from db_pool import connection
+from instrumentation import logger
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 load_dotenv("keys.env")
 warnings.filterwarnings("ignore")
 
-# --- IMPORTANT: MySQL DB_CONFIG for basic_nodes_bot ---
-# Ensure these details match your 'restaurant_new_db' setup
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',        # Your MySQL username
-    'password': '12345678', # Your MySQL password
-    'database': os.getenv('DB_NAME') # The database where 'Orders' table is
-}
-# ----------------------------------------------------
-
-# Establish a single, persistent MySQL connection for the bot's session
-try:
-    mysql_conn = mysql.connector.connect(**DB_CONFIG)
-    print("MySQL connection established for basic_nodes_bot.")
-except mysql.connector.Error as err:
-    print(f"Error connecting to MySQL for basic_nodes_bot: {err}")
-    mysql_conn = None # Set to None if connection fails
-
-# Check if DB connection failed
-if mysql_conn is None:
-    print("FATAL: Database connection failed. Bot will not be able to save orders or deplete inventory.")
-
+# Everything expensive (MySQL, menu CSV, LLM client, embedding model, indexes) is a lazily built
+# resource: importing this module is cheap, makegraph() warms the resources up in the background,
+# and each node waits only for what it needs. basic_nodes_bot.<name> still works for all of them.
+resources = Resources()
 parser = PydanticOutputParser(pydantic_object=Order)
-menu = pd.read_csv("sqldatafiles/meals_new.csv")
-
-menu_searcher = MultiSearch(menu, bm_thresh= 0.01)
+routed_parser = PydanticOutputParser(pydantic_object=RoutedOrder)
 
 # Defining chains and tools
 LLM_NAME="gpt-oss-120b-groq"
-
-if LLM_NAME == "llama-local":
-    llm = init_chat_model("ollama:llama3.1")
-elif LLM_NAME == "gpt-oss-120b-groq":
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model='openai/gpt-oss-120b')
-elif LLM_NAME == "gpt-oss-20b-groq":
-    llm = ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model='openai/gpt-oss-20b')
-
-
-orderChain = orderPrompt | llm | parser
-conversationChain = conversationPrompt | llm
-routerChain = routerPrompt | llm
-
-retriever = makeRetriever(menu, search_type="similarity", k=10)
-corpus = list(menu["item_name"])
-tcorpus = [c.lower().split() for c in corpus]
-#bm_searcher = BM25Okapi(tcorpus)
-embedder = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-vectordb = FAISS.from_texts(corpus, embedder)
-emb_thresh=0.5
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# menu matching scores are raw cosine similarity; 0.5 was the old FAISS relevance cutoff (~0.646 cosine)
+emb_thresh=faiss_relevance_to_cosine(0.5)
 seq_thresh=0.5
 
 
-def makegraph():
+# compiled by `python menu_artifact.py compile`; None (build everything from the CSV) if missing or stale
+resources.register("menu_artifact", lambda res: load_artifact(menu_path=MENU_PATH, embedding_model=EMBEDDING_MODEL))
+
+@resources.resource("availability")
+def _availability(res):
+    # MySQL connections come from the shared pool in db_pool.py (configured from keys.env)
+    # in-memory availability, kept current incrementally on checkout
+    artifact = res.get("menu_artifact")
+    with connection() as conn:
+        if conn is None:
+            logger.error("Database connection failed. Bot will not be able to save orders or deplete inventory.")
+            return None
+        if artifact is not None and artifact.has_recipes():
+            return AvailabilityEngine.from_artifact(artifact, conn)
+        return AvailabilityEngine.from_db(conn)
+
+@resources.resource("menu")
+def _menu(res):
+    artifact = res.get("menu_artifact")
+    return artifact.menu_df() if artifact is not None else pd.read_csv(MENU_PATH)
+
+@resources.resource("menu_index")
+def _menu_index(res):
+    artifact = res.get("menu_artifact")
+    return MenuIndex(res.get("menu"), aliases=artifact.aliases() if artifact is not None else load_aliases())
+
+@resources.resource("llm")
+def _llm(res):
+    if LLM_NAME == "llama-local":
+        return init_chat_model("ollama:llama3.1")
+    elif LLM_NAME == "gpt-oss-120b-groq":
+        return ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model='openai/gpt-oss-120b')
+    elif LLM_NAME == "gpt-oss-20b-groq":
+        return ChatGroq(api_key=os.getenv("GROQ_API_KEY"), model='openai/gpt-oss-20b')
+
+resources.register("orderChain", lambda res: orderPrompt | res.get("llm") | parser)
+resources.register("conversationChain", lambda res: conversationPrompt | res.get("llm"))
+resources.register("routerChain", lambda res: routerPrompt | res.get("llm"))
+resources.register("routedOrderChain", lambda res: routedOrderPrompt | res.get("llm") | routed_parser)
+
+@resources.resource("embedder")
+def _embedder(res):
+    # the one embedding model instance shared by the retriever, searchers, caches and intent classifier
+    from langchain_huggingface import HuggingFaceEmbeddings # imports torch, so only when first needed
+    return CachedEmbeddings(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL), model_name=EMBEDDING_MODEL)
+
+@resources.resource("retriever")
+def _retriever(res):
+    artifact = res.get("menu_artifact")
+    doc_embeddings = artifact.document_embeddings() if artifact is not None else None
+    return makeRetriever(res.get("menu"), search_type="similarity", k=10, embedder=res.get("embedder"), doc_embeddings=doc_embeddings)
+
+@resources.resource("bm_searcher")
+def _bm_searcher(res):
+    artifact = res.get("menu_artifact")
+    return artifact.bm25() if artifact is not None else BM25Index.from_menu(res.get("menu"))
+
+resources.register("intent_classifier", lambda res: IntentClassifier(embedder=res.get("embedder"), menu_index=res.get("menu_index")))
+resources.register("order_parser", lambda res: OrderParser(res.get("menu_index")))
+# menu answers keyed on the menu/availability versions; the ttl bounds staleness when there is no availability engine
+resources.register("response_cache", lambda res: LRUCache(maxsize=16, ttl=300))
+@resources.resource("menu_searcher")
+def _menu_searcher(res):
+    artifact = res.get("menu_artifact")
+    if artifact is None:
+        return MultiSearch(res.get("menu"), bm_thresh= 0.01, embedder=res.get("embedder"), menu_index=res.get("menu_index"))
+    return MultiSearch(res.get("menu"), bm_thresh= 0.01, embedder=res.get("embedder"), menu_index=res.get("menu_index"),
+                       menu_embeddings=artifact.name_embeddings(), trigram_index=artifact.trigram_index())
+
+
+def __getattr__(name):
+    # module attributes such as menu_index, availability or embedder are built on first access
+    if name in resources:
+        return resources.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def makegraph(profile=None, llm=None, warmup=True, use_async=False, speculative=False, combined_router=False):
+    """
+    Builds the order graph. profile=True (shared profiler.default_profiler) or a NodeProfiler
+    instance records per-node wall time, LLM tokens, DB round trips and embedding calls.
+    llm replaces the module's chat model in all three chains (e.g. a deterministic stub for benchmarks).
+    warmup=True starts building every resource on a background thread pool; nodes fetch their
+    resources when they run, so the graph is usable immediately.
+    use_async=True builds async nodes (LLM calls via ainvoke, MySQL/embedding work on worker
+    threads); run the graph with ainvoke/astream, e.g. through async_runtime.run().
+    speculative=True (default SpeculationGuard) or a SpeculationGuard runs order extraction
+    concurrently with the router LLM call; order turns then skip the extract_order node.
+    combined_router=True routes and extracts with one structured-output call (RoutedOrder)
+    instead; compare it against the default pipeline with benchmarks/replay_conversations.py.
+    """
+    if speculative and combined_router:
+        raise ValueError("speculative and combined_router are alternative router modes; pick one")
+    if profile is True:
+        profile = default_profiler
+    guard = SpeculationGuard() if speculative is True else (speculative or None)
+    R = resources.get
+    if llm is not None:
+        chains = {
+            "routerChain": routerPrompt | llm,
+            "orderChain": orderPrompt | llm | parser,
+            "conversationChain": conversationPrompt | llm,
+            "routedOrderChain": routedOrderPrompt | llm | routed_parser,
+        }
+        chain = chains.get
+    else:
+        chain = R
+
+    async def achain(name):
+        return chains[name] if llm is not None else await resources.aget(name)
+
+    if warmup:
+        skip = set() if llm is None else {"llm", *chains}
+        resources.warmup(names=[n for n in resources.names() if n not in skip], wait=False)
     builder = StateGraph(State)
-    builder.add_node("router", lambda s: router_node(s, routerChain))
-    builder.add_node("extract_order", lambda s: extract_order_node(s, orderChain, parser))
-    builder.add_node("menu_query", lambda s: menu_query_node(s, conversationChain, retriever))
-    builder.add_node("process_order", lambda s: processOrder(s, menu_searcher, None, vectordb, emb_thresh, seq_thresh))
-    builder.add_node("delete_order", lambda s: deleteOrder(s, embedder, seq_thresh))
-    builder.add_node("modify_order", lambda s: modifyOrder(s, embedder, seq_thresh))
-    builder.add_node("confirm_order", confirm_order)
-    builder.add_node("display_rejected", display_rejected)
-    builder.add_node("clarify_options", clarify_options_node)
+
+    def add_node(name, fn):
+        builder.add_node(name, profile.wrap(name, fn) if profile else fn)
+
+    # blocking nodes; in async mode they run on worker threads (resource waits included)
+    blocking = {
+        "menu_query": lambda s: menu_query_node(s, chain("conversationChain"), R("retriever"), R("menu_index"), R("response_cache"), R("availability")),
+        "process_order": lambda s: processOrder(s, R("menu_searcher"), R("bm_searcher"), emb_thresh, seq_thresh),
+        "delete_order": lambda s: deleteOrder(s, R("embedder"), seq_thresh, R("menu_index")),
+        "modify_order": lambda s: modifyOrder(s, R("embedder"), seq_thresh, R("menu_index")),
+    }
+    if use_async:
+        async def router(s):
+            if combined_router:
+                return await arouted_order_node(s, await achain("routedOrderChain"), routed_parser,
+                                                await resources.aget("intent_classifier"), await resources.aget("order_parser"))
+            if guard is not None:
+                return await aspeculative_router_node(s, await achain("routerChain"), await achain("orderChain"), parser,
+                                                      await resources.aget("intent_classifier"), await resources.aget("order_parser"), guard)
+            return await arouter_node(s, await achain("routerChain"), await resources.aget("intent_classifier"))
+
+        async def extract_order(s):
+            return await aextract_order_node(s, await achain("orderChain"), parser, await resources.aget("order_parser"))
+
+        add_node("router", router)
+        add_node("extract_order", extract_order)
+        for name, fn in blocking.items():
+            add_node(name, offload(fn))
+    else:
+        if combined_router:
+            add_node("router", lambda s: routed_order_node(s, chain("routedOrderChain"), routed_parser, R("intent_classifier"), R("order_parser")))
+        elif guard is not None:
+            add_node("router", lambda s: speculative_router_node(s, chain("routerChain"), chain("orderChain"), parser, R("intent_classifier"), R("order_parser"), guard))
+        else:
+            add_node("router", lambda s: router_node(s, chain("routerChain"), R("intent_classifier")))
+        add_node("extract_order", lambda s: extract_order_node(s, chain("orderChain"), parser, R("order_parser")))
+        for name, fn in blocking.items():
+            add_node(name, fn)
+    add_node("confirm_order", confirm_order)
+    add_node("display_rejected", display_rejected)
+    add_node("clarify_options", clarify_options_node)
     builder.add_edge(START, "router")
     builder.add_conditional_edges(
         "router",
         routeFunc, 
         {
-            "extract": "extract_order",
+            # a speculative or combined router has already extracted the order
+            "extract": "delete_order" if guard is not None or combined_router else "extract_order",
             "conversation": "menu_query"
         }
     )
@@ -126,6 +243,7 @@ def makegraph():
 
 if __name__ == "__main__":
     graph = makegraph()
+    menu_index, availability = resources.get("menu_index"), resources.get("availability")
     draw = False
 
     if draw:
@@ -142,82 +260,80 @@ if __name__ == "__main__":
         "rejected_items": []
     })
 
-    try:
-        while True:
-            user_input = input("You: ")
+    while True:
+        user_input = input("You: ")
 
-            if user_input.lower().strip() in {"exit", "bye", "quit", "q"}:
-                print("\nChatbot: Bye!")
-                break
+        if user_input.lower().strip() in {"exit", "bye", "quit", "q"}:
+            print("\nChatbot: Bye!")
+            break
 
-            if user_input.lower().strip() in {"checkout", "confirm", "yes", "y"}:
-                current_cart = graph.get_state(config=config).values.get('cart', [])
-            
-                if current_cart:
-                    # Call insert_orders_from_bot and get its detailed result
-                    order_process_result = insert_orders_from_bot(current_cart, mysql_conn, deplete_inventory_from_order)
-                    if order_process_result["unavailable_meals"]:
-                        confirmation_message=[]
+        if user_input.lower().strip() in {"checkout", "confirm", "yes", "y"}:
+            current_cart = graph.get_state(config=config).values.get('cart', [])
+        
+            if current_cart:
+                # Call insert_orders_from_bot and get its detailed result
+                with connection() as conn:
+                    order_process_result = insert_orders_from_bot(current_cart, conn, deplete_inventory_from_order, menu_index, availability, reserve_stock_func=reserve_stock)
+                if order_process_result["success"]:
+                    confirmation_message = "\nChatbot: Order confirmed and will be sent to the Kitchen! Thank you."
+                    if order_process_result.get("unavailable_meals", []):
                         unavailable_names = ", ".join([m['meal_name'] for m in order_process_result["unavailable_meals"]])
                         confirmation_message += f"\nNote: The following meals are now unavailable due to ingredient shortages: {unavailable_names}."
-                        
-                    if order_process_result["success"]:
-                        confirmation_message = "\nChatbot: Order confirmed and will be sent to the Kitchen! Thank you."
+                
+                    if order_process_result.get("rejected_items"):
+                        rejected_names = ", ".join(f"{r['quantity']} x {r['item_name']}" for r in order_process_result["rejected_items"])
+                        confirmation_message += f"\nSorry, we ran out of stock for: {rejected_names}. These were not included in your order."
+
+                    print(confirmation_message)
                     
-                        print(confirmation_message)
-                        
-                        # Reset the cart in the graph state for a new order
-                        # Also clear 'most_recent_order' to avoid lingering data
-                        graph.update_state(config, {"cart": [], "most_recent_order": None})
-                        
-                        # Explicitly display the updated menu after order confirmation
-                        # This directly invokes the logic from the menu_query_node (from your nodes.py)
-                        # to show both available and unavailable items.
-                        conn_for_menu = mysql_conn # Use the existing connection
+                    # Reset the cart in the graph state for a new order
+                    # Also clear 'most_recent_order' to avoid lingering data
+                    graph.update_state(config, {"cart": [], "most_recent_order": None})
+                    
+                    # Explicitly display the updated menu after order confirmation
+                    # This directly invokes the logic from the menu_query_node (from your nodes.py)
+                    # to show both available and unavailable items.
+                    with connection() as conn_for_menu: # pooled connection for the menu refresh
                         if conn_for_menu and conn_for_menu.is_connected():
-                            available_meals_after_order = get_available_menu_meals(conn_for_menu)
-                            unavailable_meals_after_order = get_unavailable_meals(conn_for_menu)
+                            available_meals_after_order = get_available_menu_meals(conn_for_menu, availability)
+                            unavailable_meals_after_order = get_unavailable_meals(conn_for_menu, availability)
 
                             menu_display_str = ""
                             if available_meals_after_order:
                                 menu_display_str += "\nOur current menu includes:\n"
                                 for meal in available_meals_after_order:
                                     menu_display_str += f"- {meal['meal_name']}\n"
-                            
+                        
                             if unavailable_meals_after_order:
                                 if available_meals_after_order:
                                     menu_display_str += "\n"
                                 menu_display_str += "Please note, the following meals are currently unavailable due to insufficient ingredients:\n"
                                 for meal in unavailable_meals_after_order:
                                     menu_display_str += f"- {meal['meal_name']}\n"
-                            
+                        
                             if not available_meals_after_order and not unavailable_meals_after_order:
                                 menu_display_str = "\nI'm sorry, I can't retrieve the menu right now. Please try again later."
                             elif not available_meals_after_order and unavailable_meals_after_order:
                                 menu_display_str += "\nIs there anything else I can help you with?"
                             else:
                                 menu_display_str += "\nWhat would you like to order next?"
-                            
+                        
                             print(f"\nChatbot: {menu_display_str}")
                         else:
                             print("\nChatbot: I'm sorry, I can't display the updated menu. Database connection is not available.")
-                        
-                    else:
-                        print(f"Chatbot: There was an issue processing your order: {order_process_result.get('error', 'Unknown error')}. Please try again.")
                     
                 else:
-                    print("Chatbot: Your cart is empty, nothing to save. Please add items before confirming.")
+                    print(f"Chatbot: There was an issue processing your order: {order_process_result.get('error', 'Unknown error')}. Please try again.")
                 
-                continue # Continue the loop for next user input
-                        
-            for update in graph.stream({"messages": [HumanMessage(user_input)]}, config=config):
-                for step, output in update.items():
-                    if "messages" in output:
-                        for m in output["messages"]:
-                            if isinstance(m, (AIMessage, ToolMessage)):
-                                print(f"Chatbot: {m.content}")
+            else:
+                print("Chatbot: Your cart is empty, nothing to save. Please add items before confirming.")
             
-    finally:
-        if mysql_conn:
-            mysql_conn.close()
-            print("\nMySQL database connection closed.")
+            continue # Continue the loop for next user input
+                    
+        for update in graph.stream({"messages": [HumanMessage(user_input)]}, config=config):
+            for step, output in update.items():
+                if "messages" in output:
+                    for m in output["messages"]:
+                        if isinstance(m, (AIMessage, ToolMessage)):
+                            print(f"Chatbot: {m.content}")
+
@@ -0,0 +1,275 @@
+"""
+Micro-benchmarks for the menu matching and inventory hot paths, over synthetic menus.
+
+    python benchmarks/micro_benchmarks.py --sizes 100 10000 100000 --carts 1 10 50 200 \
+        --out benchmarks/results/micro.json
+
+Benchmarked, per menu size:
+  - MultiSearch.unify            exact / typo / unknown queries (resolution cache cleared per call)
+  - MenuValidator.validate_item  exact / partial / typo
+  - nodes.deleteOrder / modifyOrder  per cart size, exact and misspelt target (sequence + embedding fallback)
+  - Classes.OrderUpdate.count_ordered_items  per cart size
+  - db_utils.get_unavailable_meals  full SQL scan vs. AvailabilityEngine, on an in-memory SQLite copy
+
+Every case reports min / median / mean / stddev per call in ms (pytest-benchmark style), so an
+optimization of one of these paths can quote before/after numbers from two runs of this script.
+tests/test_benchmarks.py runs the same paths under pytest-benchmark with per-call budgets.
+Embeddings come from a deterministic fake embedder: this measures our code, not the model.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from difflib import SequenceMatcher
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from availability import AvailabilityEngine
+from Classes import Item, Order, OrderUpdate
+from db_utils import get_unavailable_meals
+from menu_index import MenuIndex
+from nodes import deleteOrder, modifyOrder
+from searchers import BM25Index, MenuValidator, MultiSearch, faiss_relevance_to_cosine
+
+ADJECTIVES = ["spicy", "smoky", "crispy", "classic", "tandoori", "garlic", "herb", "grilled", "creamy", "tangy",
+              "sweet", "masala", "butter", "lemon", "pepper", "honey", "chilli", "roasted", "royal", "golden",
+              "mughlai", "coastal", "rustic", "zesty", "peri peri", "kashmiri", "malai", "achari", "hariyali", "mint",
+              "saffron", "coconut", "cajun", "teriyaki", "sesame", "mango", "ginger", "cheesy", "tikka", "afghani",
+              "punjabi", "bbq", "jalapeno", "truffle", "basil", "paprika", "cumin", "curry leaf", "smoked", "caramel"]
+MAINS = ["paneer", "chicken", "lamb", "prawn", "fish", "mushroom", "tofu", "egg", "potato", "cauliflower",
+         "chickpea", "lentil", "spinach", "corn", "beef", "duck", "crab", "okra", "eggplant", "jackfruit",
+         "cottage cheese", "turkey", "mutton", "squid", "salmon", "tuna", "pumpkin", "beetroot", "carrot", "pea",
+         "bean", "quinoa", "rice", "noodle", "cabbage", "broccoli", "zucchini", "kidney bean", "soya", "halloumi",
+         "avocado", "apple", "banana", "berry", "chocolate", "vanilla", "pistachio", "almond", "cashew", "walnut"]
+DISHES = ["curry", "biryani", "wrap", "burger", "pizza", "salad", "soup", "tikka", "kebab", "roll",
+          "bowl", "sandwich", "pasta", "noodles", "fried rice", "dosa", "paratha", "taco", "risotto", "stew",
+          "korma", "vindaloo", "pulao", "samosa", "pakora", "skewers", "platter", "quesadilla", "shake", "lassi",
+          "sundae", "pie", "tart", "cake", "kulfi", "smoothie", "toast", "omelette", "frankie", "bao",
+          "momos", "gyoza", "sliders", "fritters", "chaat", "bhaji", "uttapam", "idli", "thali", "masala"]
+
+
+def synthetic_menu(n, seed=0):
+    """n unique three-word menu items with descriptions, ingredients and prices."""
+    rng = random.Random(seed)
+    combos = list(itertools.product(ADJECTIVES, MAINS, DISHES))
+    rng.shuffle(combos)
+    if n > len(combos):
+        raise ValueError(f"at most {len(combos)} synthetic items")
+    rows = []
+    for i, (adj, main, dish) in enumerate(combos[:n]):
+        rows.append({
+            "meal_id": i + 1,
+            "item_name": f"{adj} {main} {dish}".title(),
+            "category": dish,
+            "price": round(rng.uniform(100, 900), 2),
+            "description": f"{adj} {main} {dish} cooked with {rng.choice(MAINS)} and {rng.choice(ADJECTIVES)} spices.",
+            "ingredients": ", ".join([main, rng.choice(MAINS), rng.choice(MAINS), "spices"]),
+        })
+    return pd.DataFrame(rows)
+
+
+def typo(name, rng):
+    """Swap two adjacent, different letters (never a no-op)."""
+    chars = list(name)
+    spots = [i for i in range(1, len(chars) - 1) if chars[i].isalpha() and chars[i + 1].isalpha() and chars[i] != chars[i + 1]]
+    i = rng.choice(spots)
+    chars[i], chars[i + 1] = chars[i + 1], chars[i]
+    return "".join(chars)
+
+
+def fuzzy_target(cart_names, rng, attempts=100):
+    """A misspelling of one cart name that only that name matches with certainty (SequenceMatcher >= 0.8),
+    so deleteOrder / modifyOrder take the sequence + embedding path without asking which item was meant."""
+    for _ in range(attempts):
+        name = rng.choice(cart_names)
+        query = typo(name, rng)
+        if [c for c in cart_names if SequenceMatcher(None, query.lower(), c.lower()).ratio() >= 0.8] == [name]:
+            return query
+    raise ValueError("no unambiguous misspelling found for this cart")
+
+
+def bench(fn, min_time=0.2, repeat=5):
+    """pytest-benchmark style timing: auto-sized inner loop, `repeat` rounds, per-call ms stats."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    rounds = [t / number * 1000 for t in timer.repeat(repeat=repeat, number=number)]
+    return {"min_ms": min(rounds), "median_ms": statistics.median(rounds), "mean_ms": statistics.fmean(rounds),
+            "stddev_ms": statistics.pstdev(rounds), "rounds": repeat, "calls_per_round": number}
+
+
+# --- SQLite stand-in for the MySQL connection used by db_utils / AvailabilityEngine ---
+
+class SQLiteCursor:
+    """Accepts mysql.connector-style %s placeholders and returns dict rows when dictionary=True."""
+
+    def __init__(self, conn, dictionary):
+        self._cursor = conn.cursor()
+        self._dictionary = dictionary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+        return False
+
+    def execute(self, query, params=()):
+        self._cursor.execute(query.replace("%s", "?"), params)
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if not self._dictionary:
+            return rows
+        columns = [d[0] for d in self._cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self._conn, dictionary)
+
+    def is_connected(self):
+        return True
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+
+def sqlite_restaurant(menu, ingredients_per_meal=5, seed=0):
+    """In-memory SQLite copy of the Meals / Ingredients / Recipe_Ingredients schema; ~10% of meals short."""
+    rng = random.Random(seed)
+    db = sqlite3.connect(":memory:")
+    db.executescript("""
+        CREATE TABLE Meals (meal_id INTEGER PRIMARY KEY, name TEXT, price REAL);
+        CREATE TABLE Ingredients (ingredient_id INTEGER PRIMARY KEY, ingredient_name TEXT, current_inventory REAL, unit TEXT);
+        CREATE TABLE Recipe_Ingredients (Meal_ID INTEGER, Ingredient_ID INTEGER, quantity REAL);
+    """)
+    n_ingredients = max(20, min(len(menu) // 2, 5000))
+    db.executemany("INSERT INTO Meals VALUES (?, ?, ?)", menu[["meal_id", "item_name", "price"]].itertuples(index=False, name=None))
+    db.executemany("INSERT INTO Ingredients VALUES (?, ?, ?, ?)",
+                   [(i, f"ingredient {i}", 0.5 if rng.random() < 0.02 else rng.choice([50.0, 500.0, 5000.0]), "g")
+                    for i in range(1, n_ingredients + 1)])
+    recipes = [(meal_id, ing, float(rng.choice([1, 2, 5, 10])))
+               for meal_id in menu["meal_id"] for ing in rng.sample(range(1, n_ingredients + 1), ingredients_per_meal)]
+    db.executemany("INSERT INTO Recipe_Ingredients VALUES (?, ?, ?)", recipes)
+    db.commit()
+    return SQLiteConnection(db)
+
+
+def run_size(n, cart_sizes, min_time):
+    rng = random.Random(n)
+    results = {}
+    t0 = time.perf_counter()
+    menu = synthetic_menu(n)
+    embedder = DeterministicFakeEmbedding(size=384)
+    menu_index = MenuIndex(menu)
+    searcher = MultiSearch(menu.copy(), bm_thresh=0.01, embedder=embedder, menu_index=menu_index)
+    bm_searcher = BM25Index.from_menu(menu)
+    validator = MenuValidator(menu.copy(), menu_index=menu_index, trigram_index=searcher.trigram_index)
+    results["setup_s"] = time.perf_counter() - t0
+
+    names = menu["item_name"].tolist()
+    exact, misspelt = rng.choice(names), typo(rng.choice(names), rng)
+    partial = " ".join(rng.choice(names).split()[1:])
+    unknown = "deep fried unicorn steak"
+
+    def unify(query):
+        def call():
+            searcher.resolution_cache.clear()
+            searcher.unify(query, bm_searcher, emb_thresh=faiss_relevance_to_cosine(0.5), seq_thresh=0.5)
+        return call
+
+    results["MultiSearch.unify[exact]"] = bench(unify(exact), min_time)
+    results["MultiSearch.unify[typo]"] = bench(unify(misspelt), min_time)
+    results["MultiSearch.unify[unknown]"] = bench(unify(unknown), min_time)
+    results["MenuValidator.validate_item[exact]"] = bench(lambda: validator.validate_item(exact), min_time)
+    results["MenuValidator.validate_item[partial]"] = bench(lambda: validator.validate_item(partial), min_time)
+    results["MenuValidator.validate_item[typo]"] = bench(lambda: validator.validate_item(misspelt), min_time)
+
+    for size in cart_sizes:
+        cart = [Item(item_name=name, quantity=rng.randint(1, 3), modifiers=["extra cheese"] if i % 3 == 0 else [])
+                for i, name in enumerate(rng.sample(names, min(size, len(names))))]
+        exact_target = cart[-1].item_name # exact cart name: resolved before any matching
+        typo_target = fuzzy_target([c.item_name for c in cart], rng) # sequence match + embed_query / embed_documents
+
+        def delete_call(target):
+            def call():
+                state = {"cart": [c.model_copy() for c in cart], "most_recent_order": Order(items=[], delete=[Item(item_name=target, quantity=1)], modify=[])}
+                deleteOrder(state, embedder, 0.6, menu_index)
+            return call
+
+        def modify_call(target):
+            def call():
+                state = {"cart": [c.model_copy() for c in cart], "most_recent_order": Order(items=[], delete=[], modify=[Item(item_name=target, quantity=2)])}
+                modifyOrder(state, embedder, 0.6, menu_index)
+            return call
+
+        order = Order(items=cart, delete=[], modify=[])
+        results[f"nodes.deleteOrder[cart={size}]"] = bench(delete_call(exact_target), min_time)
+        results[f"nodes.deleteOrder[cart={size},typo]"] = bench(delete_call(typo_target), min_time)
+        results[f"nodes.modifyOrder[cart={size}]"] = bench(modify_call(exact_target), min_time)
+        results[f"nodes.modifyOrder[cart={size},typo]"] = bench(modify_call(typo_target), min_time)
+        results[f"OrderUpdate.count_ordered_items[cart={size}]"] = bench(lambda: OrderUpdate().count_ordered_items(order, menu), min_time)
+
+    conn = sqlite_restaurant(menu)
+    engine = AvailabilityEngine.from_db(conn, max_age=None)
+    results["get_unavailable_meals[sql scan]"] = bench(lambda: get_unavailable_meals(conn), min_time)
+    results["get_unavailable_meals[availability engine]"] = bench(lambda: get_unavailable_meals(conn, engine), min_time)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    ap.add_argument("--carts", type=int, nargs="+", default=[1, 10, 50, 200])
+    ap.add_argument("--min-time", type=float, default=0.2, help="seconds per timing round (approx.)")
+    ap.add_argument("--out", default="benchmarks/results/micro.json")
+    args = ap.parse_args()
+
+    report = {"revision": git_revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "sizes": {}}
+    for n in args.sizes:
+        print(f"menu size {n}")
+        report["sizes"][str(n)] = results = run_size(n, args.carts, args.min_time)
+        print(f"  setup {results['setup_s']:.2f} s")
+        for case, stats in results.items():
+            if case != "setup_s":
+                print(f"  {case:<50} median {stats['median_ms']:10.4f} ms  min {stats['min_ms']:10.4f} ms")
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"-> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
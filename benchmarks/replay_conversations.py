@@ -0,0 +1,189 @@
+"""
+End-to-end latency benchmark: replays multi-turn conversations through basic_nodes_bot.makegraph()
+with a deterministic stub chat model and writes the results as JSON.
+
+    python benchmarks/replay_conversations.py --threads 1 4 8 --out benchmarks/results/replay.json
+
+Conversations default to misc/sample_input.sample_sequences; --conversations takes a JSON file
+holding a list of conversations (each a list of user turns). Reported:
+  - per-turn latency distribution (single thread)
+  - LLM calls and tokens per turn
+  - per-node latency/tokens/DB round trips/embedding calls (profiler.NodeProfiler)
+  - throughput in turns/s at each --threads value (one graph, one conversation per thread_id)
+    --async builds makegraph(use_async=True) and runs everything on one event loop; --threads
+    is then the number of conversations in flight at once
+    --speculative runs order extraction alongside the router call (speculation.SpeculationGuard)
+    --combined-router routes and extracts with one LLM call (A/B against the default pipeline)
+  - peak RSS of the process
+Menu queries hit MySQL through the shared pool when it is reachable, so run against the same
+database between commits to keep numbers comparable.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT) # the bot loads sqldatafiles/... relative to the repo root
+os.environ.setdefault("GROQ_API_KEY", "stub") # makegraph(llm=stub) never builds the ChatGroq client, this is a fallback
+
+from langchain_core.messages import HumanMessage
+
+import basic_nodes_bot
+from profiler import NodeProfiler
+from speculation import SpeculationGuard
+from stub_llm import StubChatModel
+from misc.sample_input import sample_sequences
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"count": len(values), "mean_ms": float(arr.mean()), "p50_ms": float(p50), "p95_ms": float(p95),
+            "p99_ms": float(p99), "max_ms": float(arr.max())}
+
+
+def replay(graph, conversation, thread_id):
+    """Runs one conversation; returns the latency (ms) of each turn."""
+    config = {"configurable": {"thread_id": thread_id}}
+    graph.update_state(config, {"cart": [], "rejected_items": [], "internals": [], "most_recent_order": None})
+    latencies = []
+    for turn in conversation:
+        start = time.perf_counter()
+        graph.invoke({"messages": [HumanMessage(turn)]}, config=config)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def areplay(graph, conversation, thread_id):
+    config = {"configurable": {"thread_id": thread_id}}
+    graph.update_state(config, {"cart": [], "rejected_items": [], "internals": [], "most_recent_order": None})
+    latencies = []
+    for turn in conversation:
+        start = time.perf_counter()
+        await graph.ainvoke({"messages": [HumanMessage(turn)]}, config=config)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def throughput(graph, conversations, threads, rounds):
+    jobs = [(conv, f"bench-{threads}-{i}") for i, conv in enumerate(conversations * rounds)]
+    turns = sum(len(conv) for conv, _ in jobs)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda job: replay(graph, *job), jobs))
+    elapsed = time.perf_counter() - start
+    return {"threads": threads, "turns": turns, "seconds": elapsed, "turns_per_second": turns / elapsed}
+
+
+async def athroughput(graph, conversations, concurrency, rounds):
+    jobs = [(conv, f"bench-{concurrency}-{i}") for i, conv in enumerate(conversations * rounds)]
+    turns = sum(len(conv) for conv, _ in jobs)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(job):
+        async with slots:
+            return await areplay(graph, *job)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(job) for job in jobs))
+    elapsed = time.perf_counter() - start
+    return {"threads": concurrency, "turns": turns, "seconds": elapsed, "turns_per_second": turns / elapsed}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--conversations", help="JSON file with a list of conversations (lists of user turns)")
+    ap.add_argument("--rounds", type=int, default=3, help="times each conversation is replayed per measurement")
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated model latency per LLM call")
+    ap.add_argument("--warmup", type=int, default=1, help="untimed replays of the first conversation")
+    ap.add_argument("--async", dest="use_async", action="store_true", help="benchmark the async graph")
+    ap.add_argument("--speculative", action="store_true", help="speculative router + extraction")
+    ap.add_argument("--combined-router", action="store_true", help="single-call router + extractor")
+    ap.add_argument("--out", default="benchmarks/results/replay.json")
+    args = ap.parse_args()
+
+    if args.conversations:
+        with open(args.conversations) as f:
+            conversations = json.load(f)
+    else:
+        conversations = sample_sequences
+
+    stub = StubChatModel(menu_index=basic_nodes_bot.menu_index, latency_ms=args.llm_latency_ms)
+    profiler = NodeProfiler(window=100_000)
+    guard = SpeculationGuard() if args.speculative else None
+    graph = basic_nodes_bot.makegraph(profile=profiler, llm=stub, use_async=args.use_async, speculative=guard,
+                                      combined_router=args.combined_router)
+    if args.use_async:
+        loop = asyncio.new_event_loop()
+        run_replay = lambda conv, tid: loop.run_until_complete(areplay(graph, conv, tid))
+        run_throughput = lambda n: loop.run_until_complete(athroughput(graph, conversations, n, args.rounds))
+    else:
+        run_replay = lambda conv, tid: replay(graph, conv, tid)
+        run_throughput = lambda n: throughput(graph, conversations, n, args.rounds)
+
+    for i in range(args.warmup):
+        run_replay(conversations[0], f"warmup-{i}")
+    profiler.reset()
+
+    turn_latencies = []
+    for r in range(args.rounds):
+        for i, conv in enumerate(conversations):
+            turn_latencies += run_replay(conv, f"latency-{r}-{i}")
+    per_node = profiler.stats()
+    samples = profiler.samples()
+    llm = {
+        "calls_per_turn": sum(r["llm_calls"] for r in samples) / len(turn_latencies),
+        "tokens_per_turn": sum(r["input_tokens"] + r["output_tokens"] for r in samples) / len(turn_latencies),
+    }
+
+    results = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"conversations": len(conversations), "rounds": args.rounds, "llm_latency_ms": args.llm_latency_ms,
+                   "async": args.use_async, "speculative": args.speculative,
+                   "combined_router": args.combined_router},
+        "turn_latency": percentiles(turn_latencies),
+        "llm": llm,
+        "per_node": per_node,
+        "startup": basic_nodes_bot.resources.timings(),
+        "throughput": [run_throughput(n) for n in args.threads],
+        "speculation": guard.stats() if guard is not None else None,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != "darwin" else 1024 * 1024),
+    }
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    t = results["turn_latency"]
+    print(f"turns: {t['count']}  p50 {t['p50_ms']:.1f} ms  p95 {t['p95_ms']:.1f} ms  p99 {t['p99_ms']:.1f} ms")
+    print(f"  LLM calls/turn {llm['calls_per_turn']:.2f}  tokens/turn {llm['tokens_per_turn']:.0f}")
+    for node, s in sorted(per_node.items(), key=lambda kv: -kv[1]["p95_ms"]):
+        print(f"  {node:<18} p50 {s['p50_ms']:8.2f}  p95 {s['p95_ms']:8.2f}  calls {s['calls']}")
+    for tp in results["throughput"]:
+        print(f"  {tp['threads']:>3} threads: {tp['turns_per_second']:.1f} turns/s")
+    print(f"peak RSS {results['peak_rss_mb']:.0f} MB -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
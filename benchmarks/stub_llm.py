@@ -0,0 +1,82 @@
+import json
+import re
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from Classes import Item, Order, RoutedOrder
+from intent import IntentClassifier
+from order_parser import OrderParser
+
+# Deterministic stand-in for ChatGroq, so graph benchmarks measure our code and not the network.
+# It recognizes which promptstore prompt it was called with from the system message.
+
+ORDER_VERBS = re.compile(r"^.*?\b(i want|i'd like|i would like|can i get|can i have|i'll have|give me|order)\b\s*(to order\s+)?", re.IGNORECASE)
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Router prompt  -> "extract" / "conversation" from the local intent rules.
+    Routed order prompt (both of the above) -> RoutedOrder JSON.
+    Order prompt   -> Order JSON from OrderParser, else the text after the order verb split on "and".
+    Anything else  -> a fixed menu answer.
+    latency_ms adds a fixed sleep per call to mimic a remote model; usage_metadata is filled
+    with word counts so the profiler's token columns are exercised.
+    """
+
+    menu_index: object = None
+    latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _classifier(self):
+        return IntentClassifier(menu_index=self.menu_index)
+
+    @staticmethod
+    def _user_text(messages):
+        for m in reversed(messages):
+            if isinstance(m, HumanMessage):
+                text = m.content
+                # routerChain passes user_input as a one-element list
+                return text[2:-2] if text.startswith("['") and text.endswith("']") else text
+        return ""
+
+    def _route(self, text):
+        classifier = self._classifier()
+        label = classifier.rule_label(text)
+        if label is None:
+            # stand-in for the LLM's judgement where the local rules abstain
+            label = "extract" if any(r.search(text.lower()) for r in classifier.extract_res) else "conversation"
+        return label
+
+    def _extract(self, text):
+        order = OrderParser(self.menu_index).parse(text) if self.menu_index is not None else None
+        if order is None:
+            rest = ORDER_VERBS.sub("", text).strip(" .!?")
+            names = [re.sub(r"^(a|an|the|one)\s+", "", n.strip()) for n in re.split(r",|\band\b", rest) if n.strip()]
+            order = Order(items=[Item(item_name=n, quantity=1, modifiers=[]) for n in names], delete=[], modify=[])
+        return order.model_dump_json()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        system = next((m.content for m in messages if isinstance(m, SystemMessage)), "")
+        text = self._user_text(messages)
+        if "router bot" in system and "order-taking assistant" in system:
+            intent = self._route(text)
+            order = Order.model_validate_json(self._extract(text)) if intent == "extract" else None
+            content = RoutedOrder(intent=intent, order=order).model_dump_json()
+        elif "router bot" in system:
+            content = self._route(text)
+        elif "order-taking assistant" in system:
+            content = self._extract(text)
+        else:
+            content = "Here is what we have on the menu today."
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        words_in = sum(len(str(m.content).split()) for m in messages)
+        usage = {"input_tokens": words_in, "output_tokens": len(content.split()), "total_tokens": words_in + len(content.split())}
+        message = AIMessage(content=content, usage_metadata=usage, response_metadata={"model_name": "stub"})
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -1,31 +1,16 @@
 import streamlit as st
 import pandas as pd
 import mysql.connector
-from dotenv import load_dotenv
-import os
-load_dotenv("keys.env")
+from db_pool import get_connection
 
-# --- MySQL Database Configuration ---
-# Ensure these details match your 'restaurant_new_db' setup.
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',         # Your MySQL username
-    'password': '12345678',  # Your MySQL password
-    'database': os.getenv('DB_NAME') # The database to connect to
-}
-# ----------------------------------
-
-# We will NOT cache the connection function directly.
-# Instead, we will get a fresh connection for each data fetch.
+# Connections come from the shared pool; fetch_data checks one out per fetch and returns it.
 def get_mysql_connection_uncached():
-    """Establishes and returns a connection to the MySQL database."""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except mysql.connector.Error as err:
-        st.error(f"Error connecting to MySQL: {err}")
+    """Checks out a connection from the shared MySQL pool."""
+    conn = get_connection()
+    if conn is None:
+        st.error("Error connecting to MySQL.")
         st.error("Please ensure your MySQL server is running and connection details are correct.")
-        return None
+    return conn
 
 # Now, fetch_data will create its own connection and close it.
 def fetch_data(table_name):
@@ -41,7 +26,7 @@ def fetch_data(table_name):
             return pd.DataFrame() # Return empty DataFrame on error
         finally:
             if conn.is_connected(): # Check if connection is still open before closing
-                conn.close() # Always close the connection after fetching data
+                conn.close() # Always return the connection to the pool after fetching data
     return pd.DataFrame()
 
 # --- Streamlit Dashboard Layout ---
@@ -0,0 +1,134 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import pooling
+from dotenv import load_dotenv
+
+from instrumentation import counting, incr, logger
+
+load_dotenv("keys.env") # Load environment variables for DB_NAME
+
+# --- Shared MySQL configuration for every module that talks to the database ---
+# Override with DB_HOST / DB_USER / DB_PASSWORD / DB_NAME / DB_POOL_SIZE or configure() before first use.
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'user': os.getenv('DB_USER', 'root'),        # Your MySQL username
+    'password': os.getenv('DB_PASSWORD', '12345678'), # Your MySQL password
+    'database': os.getenv('DB_NAME') # The database name from your .env file
+}
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+# ----------------------------------------------------
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def configure(pool_size=None, pool_timeout=None, **overrides):
+    """Change the shared settings (host, user, password, database, pool size). Existing pools are discarded."""
+    global POOL_SIZE, POOL_TIMEOUT
+    with _lock:
+        DB_CONFIG.update(overrides)
+        if pool_size is not None:
+            POOL_SIZE = pool_size
+        if pool_timeout is not None:
+            POOL_TIMEOUT = pool_timeout
+        _pools.clear()
+
+
+def get_pool(database=None, server_only=False):
+    """
+    Bounded connection pool for `database` (default DB_CONFIG['database']); server_only=True gives
+    a pool with no default database (for CREATE DATABASE). Pools are created lazily, one per database.
+    """
+    config = DB_CONFIG.copy()
+    if server_only:
+        config.pop('database', None)
+    elif database is not None:
+        config['database'] = database
+    key = config.get('database')
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            name = re.sub(r"[^A-Za-z0-9_]", "_", f"restaurant_{key or 'server'}")[:64]
+            pool = pooling.MySQLConnectionPool(pool_name=name, pool_size=POOL_SIZE, pool_reset_session=True, **config)
+            _pools[key] = pool
+        return pool
+
+
+def get_connection(database=None, server_only=False):
+    """
+    Check a connection out of the pool (close() returns it). The pool pings each connection on
+    checkout and reconnects dead ones. Waits up to POOL_TIMEOUT seconds if every connection is busy.
+    Returns None if MySQL is unreachable.
+    """
+    deadline = time.monotonic() + POOL_TIMEOUT
+    while True:
+        try:
+            conn = get_pool(database, server_only).get_connection()
+            # while a profiler is collecting counts, count the statements sent on this connection
+            return _CountingConnection(conn) if counting() else conn
+        except mysql.connector.errors.PoolError as err:
+            if time.monotonic() >= deadline:
+                logger.error("No free MySQL connection in the pool: %s", err)
+                return None
+            time.sleep(0.05)
+        except mysql.connector.Error as err:
+            logger.error("Error connecting to MySQL: %s. Please ensure your MySQL server is running and connection details are correct.", err)
+            return None
+
+
+class _CountingCursor:
+    """Cursor proxy that counts execute()/executemany() calls as DB round trips."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        incr("db_round_trips")
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        incr("db_round_trips")
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _CountingConnection:
+    """Connection proxy whose cursors count round trips (see _CountingCursor)."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@contextmanager
+def connection(database=None, server_only=False):
+    """`with connection() as conn:` - yields a pooled connection (or None) and always returns it to the pool."""
+    conn = get_connection(database, server_only)
+    try:
+        yield conn
+    finally:
+        if conn is not None:
+            conn.close()
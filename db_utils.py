@@ -1,8 +1,11 @@
 from datetime import datetime
 import json
+import os
+import threading
 import mysql.connector
 import time
 from inventory_depletion import deplete_inventory_from_order
+from instrumentation import logger, span
 
 # --- Helper function to get current inventory for debugging ---
 def get_ingredient_current_inventory(ingredient_id, conn):
@@ -18,24 +21,67 @@ def get_ingredient_current_inventory(ingredient_id, conn):
                 return {"name": result["ingredient_name"], "inventory": result["current_inventory"], "unit": result["unit"]}
             return None
     except mysql.connector.Error as err:
-        print(f"Error fetching inventory for ingredient ID {ingredient_id}: {err}")
+        logger.error("Error fetching inventory for ingredient ID %s: %s", ingredient_id, err)
         return None
 
-def get_unavailable_meals(conn):
+def get_ingredients_inventory(ingredient_ids, conn):
+    """Fetches {ingredient_id: {name, inventory, unit}} for many ingredients in one query."""
+    ingredient_ids = list(ingredient_ids)
+    if conn is None or not ingredient_ids:
+        return {}
+    try:
+        with conn.cursor(dictionary=True) as cursor:
+            query = "SELECT ingredient_id, ingredient_name, current_inventory, unit FROM Ingredients WHERE ingredient_id IN (%s);"
+            cursor.execute(query % ','.join(['%s'] * len(ingredient_ids)), tuple(ingredient_ids))
+            return {
+                row["ingredient_id"]: {"name": row["ingredient_name"], "inventory": row["current_inventory"], "unit": row["unit"]}
+                for row in cursor.fetchall()
+            }
+    except mysql.connector.Error as err:
+        logger.error("Error fetching inventory for ingredients %s: %s", ingredient_ids, err)
+        return {}
+
+# --- Checkout audit trail: one JSON record per saved order ---
+AUDIT_LOG_PATH = os.getenv("CHECKOUT_AUDIT_LOG", "logs/checkout_audit.jsonl")
+_audit_lock = threading.Lock()
+
+def _json_number(value):
+    return float(value) if value is not None else None
+
+def write_audit_record(record, path=None):
+    """Appends a checkout audit record (dict) as one JSON line. Failures are reported, never raised."""
+    path = path or AUDIT_LOG_PATH
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        line = json.dumps(record, default=str)
+        with _audit_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as err:
+        logger.error("Error writing checkout audit record: %s", err)
+
+def get_unavailable_meals(conn, availability=None):
     """
     Identifies and returns a list of meals that cannot be made due to insufficient ingredient inventory.
     
     Args:
         conn (mysql.connector.connection.MySQLConnection): An active MySQL database connection.
+        availability (AvailabilityEngine, optional): In-memory availability engine; when given the
+                                                     answer is read from it instead of scanning every recipe.
         
     Returns:
         list[dict]: A list of dictionaries, where each dictionary represents an unavailable meal
                     and includes its name and the missing ingredients.
     """
     if conn is None:
-        print("Error: MySQL connection not established. Cannot check for unavailable meals.")
+        logger.error("MySQL connection not established. Cannot check for unavailable meals.")
         return []
 
+    if availability is not None:
+        availability.ensure_fresh(conn)
+        return availability.unavailable_meals()
+
     unavailable_meals = []
     try:
         with conn.cursor(dictionary=True) as cursor:
@@ -91,27 +137,32 @@ def get_unavailable_meals(conn):
         return unavailable_meals
 
     except mysql.connector.Error as err:
-        print(f"An error occurred while checking for unavailable meals: {err}")
+        logger.error("An error occurred while checking for unavailable meals: %s", err)
         return []
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error("An unexpected error occurred: %s", e)
         return []
 
-def get_available_menu_meals(conn):
+def get_available_menu_meals(conn, availability=None):
     """
     Fetches all meals and filters out those that are currently unavailable due to insufficient ingredients.
 
     Args:
         conn (mysql.connector.connection.MySQLConnection): An active MySQL database connection.
+        availability (AvailabilityEngine, optional): In-memory availability engine to read from instead of MySQL.
 
     Returns:
         list[dict]: A list of dictionaries, where each dictionary represents an available meal
                     and includes its ID and name.
     """
     if conn is None:
-        print("Error: MySQL connection not established. Cannot fetch available menu meals.")
+        logger.error("MySQL connection not established. Cannot fetch available menu meals.")
         return []
 
+    if availability is not None:
+        availability.ensure_fresh(conn)
+        return availability.available_meals()
+
     try:
         with conn.cursor(dictionary=True) as cursor:
             # Get all meals
@@ -131,117 +182,160 @@ def get_available_menu_meals(conn):
             return available_meals
 
     except mysql.connector.Error as err:
-        print(f"An error occurred while fetching available menu meals: {err}")
+        logger.error("An error occurred while fetching available menu meals: %s", err)
         return []
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error("An unexpected error occurred: %s", e)
         return []
 
 
-def insert_orders_from_bot(order_data, conn, deplete_inventory_func):
+def insert_orders_from_bot(order_data, conn, deplete_inventory_func, menu_index=None, availability=None, reserve_stock_func=None):
     """
     Saves order data from the bot's 'cart' list directly to the MySQL 'Order_Items' table.
-    Then triggers inventory depletion and prints before/after inventory levels.
-    Also, it will now display meals that are unavailable after depletion.
+    Then triggers inventory depletion and writes the before/after inventory levels and the meals
+    that became unavailable to the checkout audit log (AUDIT_LOG_PATH).
     
     Args:
         order_data (list): A list of Item objects from the confirmed order.
         conn (mysql.connector.connection.MySQLConnection): An active MySQL database connection.
         deplete_inventory_func (function): The function to call for inventory depletion.
+        menu_index (MenuIndex, optional): Shared menu index; when given, meal_ids come from it
+                                          instead of querying the Meals table.
+        availability (AvailabilityEngine, optional): Updated incrementally with this order's depletion,
+                                                     replacing the full unavailable-meals scan.
+        reserve_stock_func (function, optional): inventory_depletion.reserve_stock. When given, stock is
+                                                 reserved under row locks first and only the accepted lines
+                                                 are saved, in the same transaction (deplete_inventory_func is not called).
 
     Returns:
-        dict: A dictionary with "success" (bool), "unavailable_meals" (list[dict]), and "error" (str, if any).
+        dict: A dictionary with "success" (bool), "unavailable_meals" (list[dict]), "rejected_items" (list[dict],
+              lines refused for lack of stock) and "error" (str, if any).
     """
     if conn is None:
-        print("Error: MySQL connection not established. Cannot save order.")
-        return {"success": False, "error": "MySQL connection not established."}
+        logger.error("MySQL connection not established. Cannot save order.")
+        return {"success": False, "error": "MySQL connection not established.", "unavailable_meals": [], "rejected_items": []}
 
     try:
         with conn.cursor() as cursor:
             meal_name_to_id = {}
-            try:
-                cursor.execute("SELECT name, meal_id FROM Meals")
-                meal_name_to_id = {name.lower(): meal_id for name, meal_id in cursor.fetchall()}
-            except mysql.connector.Error as err:
-                print(f"Error fetching meal_id mapping: {err}")
-                return {"success": False, "error": f"Error fetching meal_id mapping: {err}"}
+            if menu_index is not None:
+                meal_name_to_id = menu_index.meal_name_to_id()
+            else:
+                try:
+                    cursor.execute("SELECT name, meal_id FROM Meals")
+                    meal_name_to_id = {name.lower(): meal_id for name, meal_id in cursor.fetchall()}
+                except mysql.connector.Error as err:
+                    logger.error("Error fetching meal_id mapping: %s", err)
+                    return {"success": False, "error": f"Error fetching meal_id mapping: {err}", "unavailable_meals": [], "rejected_items": []}
 
             orders_to_insert = []
+            order_rows = [] # (Item, Order_Items row)
             order_id = f"ORDER_{datetime.now().strftime('%Y%m%d%H%M%S%f')}" # Generate a unique order_id
             
             for item in order_data:
                 item_name = item.item_name
                 quantity = item.quantity
                 meal_id = meal_name_to_id.get(item_name.lower())
+                if meal_id is None and menu_index is not None:
+                    meal_id = menu_index.meal_id(item_name)
                 
                 if meal_id:
                     orders_to_insert.append((order_id, meal_id, quantity))
+                    order_rows.append((item, (order_id, meal_id, quantity)))
                 else:
-                    print(f"Warning: Meal '{item_name}' not found in the database. Skipping.")
+                    logger.warning("Meal '%s' not found in the database. Skipping.", item_name)
+
+            reservation = None
+            rejected_items = []
+            if reserve_stock_func is not None and orders_to_insert:
+                # locks the ingredient rows until the commit below, so concurrent checkouts cannot oversell
+                with span("depletion", mode="reserve", lines=len(order_rows)):
+                    reservation = reserve_stock_func([item for item, _ in order_rows], conn, commit=False)
+                if reservation.get("error"):
+                    return {"success": False, "error": reservation["error"], "unavailable_meals": [], "rejected_items": []}
+                rejected_items = reservation["rejected"]
+                accepted = {id(item) for item in reservation["accepted"]}
+                orders_to_insert = [row for item, row in order_rows if id(item) in accepted]
+                if not orders_to_insert:
+                    conn.rollback()
+                    logger.info("No order items could be reserved with the current stock.")
+                    return {"success": False, "error": "Not enough stock for any item in the order.", "unavailable_meals": [], "rejected_items": rejected_items}
 
             if orders_to_insert:
                 # Insert into Order_Items table
                 insert_query = "INSERT INTO Order_Items (order_id, meal_id, quantity) VALUES (%s, %s, %s);"
                 cursor.executemany(insert_query, orders_to_insert)
-                conn.commit()
-                print(f"\n--- Order '{order_id}' saved to 'Order_Items' table. ---")
-
-                # --- Pre-depletion Inventory Check (for debugging) ---
-                print("\n--- Pre-depletion Inventory Check ---")
-                # Get unique ingredient IDs involved in the order for pre-depletion check
-                ingredients_to_check_query = """
-                    SELECT DISTINCT ri.Ingredient_ID, i.ingredient_name, i.unit
-                    FROM Order_Items oi
-                    JOIN Recipe_Ingredients ri ON oi.meal_id = ri.Meal_ID
-                    JOIN Ingredients i ON ri.Ingredient_ID = i.ingredient_id
-                    WHERE oi.order_id = %s;
-                """
-                cursor.execute(ingredients_to_check_query, (order_id,))
-                ingredients_to_check = {row[0]: {"name": row[1], "unit": row[2]} for row in cursor.fetchall()}
-
-                ingredients_before_depletion = {} # {ingredient_id: {name, inventory, unit}}
-                for ing_id, ing_data in ingredients_to_check.items():
-                    inv = get_ingredient_current_inventory(ing_id, conn)
-                    if inv:
-                        ingredients_before_depletion[ing_id] = inv
-
-                for ing_id, inv_data in ingredients_before_depletion.items():
-                    print(f"  - BEFORE: {inv_data['name']} (ID: {ing_id}): {inv_data['inventory']} {inv_data['unit']}")
-
-
-                # --- Call inventory depletion from the separate module ---
-                # The deplete_inventory_from_order function itself will print detailed DEBUG messages
-                deplete_inventory_func(order_data, conn) # Use the passed function
-
-                # --- Post-depletion Inventory Check ---
-                print("\n--- Post-depletion Inventory Check ---")
-                for ing_id, _ in ingredients_before_depletion.items(): # Use the same IDs checked before
-                    inv = get_ingredient_current_inventory(ing_id, conn)
-                    if inv:
-                        print(f"  - AFTER: {inv['name']} (ID: {ing_id}): {inv['inventory']} {inv['unit']}")
-
-                # --- Check and display unavailable meals ---
-                print("\n--- Checking for Unavailable Meals Post-Depletion ---")
-                unavailable_meals = get_unavailable_meals(conn)
-                if unavailable_meals:
-                    print("\nWARNING: The following meals are now unavailable due to insufficient ingredients:")
-                    for meal in unavailable_meals:
-                        print(f"- {meal['meal_name']}:")
-                        for missing_ing in meal['missing_ingredients']:
-                            print(f"    - Missing {missing_ing['needed']:.2f} {missing_ing['unit']} of {missing_ing['ingredient_name']}")
+                conn.commit() # with a reservation this also commits the stock decrement and releases the locks
+                logger.info("Order '%s' saved to 'Order_Items' table.", order_id)
+
+                if reservation is not None:
+                    # the reservation already applied the decrement and knows the before/after levels
+                    depleted = True
+                    inventory_before = reservation["before"]
+                    inventory_after = reservation["after"]
                 else:
-                    print("All meals remain available based on current inventory.")
+                    # ingredients touched by this order, then one batched snapshot on each side of the depletion
+                    ingredients_query = """
+                        SELECT DISTINCT ri.Ingredient_ID
+                        FROM Order_Items oi
+                        JOIN Recipe_Ingredients ri ON oi.meal_id = ri.Meal_ID
+                        WHERE oi.order_id = %s;
+                    """
+                    cursor.execute(ingredients_query, (order_id,))
+                    ingredient_ids = [row[0] for row in cursor.fetchall()]
+                    inventory_before = get_ingredients_inventory(ingredient_ids, conn)
+                    with span("depletion", mode="deplete", lines=len(orders_to_insert)):
+                        depleted = deplete_inventory_func(order_data, conn, menu_index=menu_index) # Use the passed function
+                    inventory_after = get_ingredients_inventory(ingredient_ids, conn)
+
+                with span("availability", source="checkout"):
+                    if availability is not None:
+                        if reservation is not None:
+                            availability.apply_depletion(reservation["depleted"])
+                        elif depleted:
+                            # only meals sharing an ingredient with this order are re-checked
+                            availability.deplete_order([(meal_id, quantity) for _, meal_id, quantity in orders_to_insert])
+                        else:
+                            availability.reload(conn)
+                    unavailable_meals = get_unavailable_meals(conn, availability)
+                    if menu_index is not None:
+                        # availability changed -> invalidates caches keyed on the menu version
+                        menu_index.set_unavailable([meal['meal_name'] for meal in unavailable_meals])
+
+                write_audit_record({
+                    "order_id": order_id,
+                    "timestamp": datetime.now().isoformat(),
+                    "mode": "reserve" if reservation is not None else "deplete",
+                    "depleted": bool(depleted),
+                    "lines": [{"meal_id": meal_id, "quantity": quantity} for _, meal_id, quantity in orders_to_insert],
+                    "rejected_items": rejected_items,
+                    "inventory": {
+                        str(ing_id): {
+                            "name": data["name"],
+                            "unit": data["unit"],
+                            "before": _json_number(data["inventory"]),
+                            "after": _json_number(inventory_after.get(ing_id, {}).get("inventory")),
+                        }
+                        for ing_id, data in inventory_before.items()
+                    },
+                    "unavailable_meals": [meal['meal_name'] for meal in unavailable_meals],
+                })
                 
-                return {"success": True, "unavailable_meals": unavailable_meals}
+                return {"success": True, "unavailable_meals": unavailable_meals, "rejected_items": rejected_items}
 
             else:
-                print("\nNo valid order items to save to the 'Orders' table.")
-                return {"success": False, "error": "No valid order items to save."}
+                logger.info("No valid order items to save to the 'Orders' table.")
+                return {"success": False, "error": "No valid order items to save.", "unavailable_meals": [], "rejected_items": rejected_items}
 
     except mysql.connector.Error as err:
-        print(f"An error occurred while saving orders to MySQL: {err}")
-        return {"success": False, "error": f"MySQL Error: {err}"}
+        logger.error("An error occurred while saving orders to MySQL: %s", err)
+        conn.rollback() # drops an uncommitted reservation and releases its row locks
+        return {"success": False, "error": f"MySQL Error: {err}", "unavailable_meals": [], "rejected_items": []}
     except Exception as e:
-        print(f"An unexpected error occurred while saving orders: {e}")
-        return {"success": False, "error": f"Unexpected Error: {e}"}
+        logger.error("An unexpected error occurred while saving orders: %s", e)
+        try:
+            conn.rollback() # release reservation row locks now, not when the pool resets the session
+        except mysql.connector.Error as err:
+            logger.error("Rollback after failed checkout also failed: %s", err)
+        return {"success": False, "error": f"Unexpected Error: {e}", "unavailable_meals": [], "rejected_items": []}
 
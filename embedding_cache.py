@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from caching import LRUCache
+from instrumentation import incr, logger
+
+try:
+    import fcntl
+except ImportError: # Windows: no cross-process lock; shards are still published atomically
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Caching front for an embedding model (e.g. HuggingFaceEmbeddings), in a directory per model name.
+
+    Documents (menu names, retriever documents, intent examples, cart names) are persisted. Each
+    batch of new vectors becomes an immutable shard, `shard-<id>.npy` plus `shard-<id>.keys.json`
+    (sha1(text) per row), written under a file lock and published by renaming the keys file last.
+    Writers never rewrite existing files, so concurrent processes cannot clobber each other and a
+    key always points at a row of its own shard. Shards are memory-mapped; once there are more than
+    `max_shards` they are merged into one.
+
+    Queries (embed_query / embed_queries: user messages, item names being resolved) are one-off,
+    so they go into a bounded in-memory LRU and never touch disk. A query that happens to be a
+    persisted document is still answered from disk.
+    """
+
+    def __init__(self, embedder, model_name, cache_dir=DEFAULT_CACHE_DIR, query_cache_size=2048, max_shards=32):
+        self.embedder = embedder
+        self.model_name = model_name
+        self.path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        self.max_shards = max_shards
+        self._lock = threading.Lock()
+        self._index = {}  # key -> (shard, memory-mapped vectors, row)
+        self._shards = {} # shard -> memory-mapped vectors
+        self._queries = LRUCache(maxsize=query_cache_size)
+        self._load()
+
+    @staticmethod
+    def _key(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _shard_file(self, shard, suffix):
+        return os.path.join(self.path, shard + suffix)
+
+    @contextmanager
+    def _file_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ".lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self, fresh=False):
+        """Map shards published since the last call (by this or another process); fresh=True rebuilds from scratch."""
+        if not os.path.isdir(self.path):
+            return
+        published = sorted(f[:-len(".keys.json")] for f in os.listdir(self.path)
+                           if f.startswith("shard-") and f.endswith(".keys.json"))
+        index, shards = dict(self._index), dict(self._shards)
+        if fresh or any(shard not in published for shard in shards):
+            # another process compacted the shards; start over from what is on disk now
+            index, shards = {}, {}
+        for shard in published:
+            if shard in shards:
+                continue
+            try:
+                vectors = np.load(self._shard_file(shard, ".npy"), mmap_mode="r")
+                with open(self._shard_file(shard, ".keys.json")) as f:
+                    keys = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("ignoring unreadable embedding cache shard %s/%s: %s", self.path, shard, e)
+                continue
+            shards[shard] = vectors
+            for row, k in enumerate(keys[:len(vectors)]):
+                index.setdefault(k, (shard, vectors, row))
+        # swapped in whole: lock-free readers see the old or the new index, never a partial one
+        self._index, self._shards = index, shards
+
+    def _write_shard(self, keys, vectors):
+        shard = f"shard-{time.time_ns():x}-{os.getpid()}"
+        np.save(self._shard_file(shard, ".tmp.npy"), np.asarray(vectors, dtype=np.float32))
+        os.replace(self._shard_file(shard, ".tmp.npy"), self._shard_file(shard, ".npy"))
+        with open(self._shard_file(shard, ".keys.tmp"), "w") as f:
+            json.dump(keys, f)
+        os.replace(self._shard_file(shard, ".keys.tmp"), self._shard_file(shard, ".keys.json"))
+        return shard
+
+    def _compact(self):
+        """Merge every shard into one (caller holds the file lock)."""
+        old = list(self._shards)
+        keys, parts = [], []
+        for shard in old:
+            rows = [(k, row) for k, (s, _, row) in self._index.items() if s == shard]
+            keys += [k for k, _ in rows]
+            parts.append(np.asarray(self._shards[shard])[[row for _, row in rows]])
+        self._write_shard(keys, np.concatenate(parts))
+        for shard in old:
+            for suffix in (".keys.json", ".npy"): # keys first: readers only see whole shards
+                try:
+                    os.remove(self._shard_file(shard, suffix))
+                except OSError:
+                    pass
+        self._load(fresh=True)
+
+    def _save(self, keys, vecs):
+        """Persist new document vectors as a new shard."""
+        with self._file_lock():
+            self._load()
+            fresh = [(k, v) for k, v in zip(keys, vecs) if k not in self._index]
+            if fresh:
+                self._write_shard([k for k, _ in fresh], [v for _, v in fresh])
+            self._load()
+            if len(self._shards) > self.max_shards:
+                self._compact()
+
+    def _vector(self, key):
+        _, vectors, row = self._index[key]
+        return np.asarray(vectors[row])
+
+    def _cached(self, key):
+        entry = self._index.get(key)
+        if entry is not None:
+            return np.asarray(entry[1][entry[2]]).tolist()
+        return self._queries.get(key)
+
+    def embed_documents(self, texts):
+        incr("embedding_calls")
+        texts = list(texts)
+        keys = [self._key(t) for t in texts]
+        with self._lock:
+            missing = {}
+            for k, t in zip(keys, texts):
+                if k not in self._index and k not in missing:
+                    missing[k] = t
+            computed = {}
+            if missing:
+                incr("embedding_model_calls")
+                vecs = self.embedder.embed_documents(list(missing.values()))
+                computed = dict(zip(missing, vecs))
+                try:
+                    self._save(list(missing), vecs)
+                except OSError as e:
+                    logger.warning("could not persist embeddings to %s: %s", self.path, e)
+            return [self._vector(k).tolist() if k in self._index else list(computed[k]) for k in keys]
+
+    def embed_queries(self, texts):
+        """Batch of one-off queries: one model call for the misses, cached in memory only."""
+        incr("embedding_calls")
+        texts = list(texts)
+        keys = [self._key(t) for t in texts]
+        found = {k: v for k in set(keys) if (v := self._cached(k)) is not None}
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        if missing:
+            incr("embedding_model_calls")
+            for k, v in zip(missing, self.embedder.embed_documents(list(missing.values()))):
+                v = list(v)
+                self._queries.put(k, v)
+                found[k] = v
+        return [found[k] for k in keys]
+
+    def embed_query(self, text):
+        incr("embedding_calls")
+        key = self._key(text)
+        vec = self._cached(key)
+        if vec is None:
+            incr("embedding_model_calls")
+            vec = list(self.embedder.embed_query(text))
+            self._queries.put(key, vec)
+        return vec
+
+    # async variants: cache hits are answered inline, only a miss (model call, shard write)
+    # goes to a worker thread, so the event loop never waits on the model
+    async def aembed_documents(self, texts):
+        texts = list(texts)
+        if all(self._key(t) in self._index for t in texts):
+            return self.embed_documents(texts)
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text):
+        if self._cached(self._key(text)) is not None:
+            return self.embed_query(text)
+        return await asyncio.to_thread(self.embed_query, text)
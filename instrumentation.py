@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+
+load_dotenv("keys.env")
+
+# Shared logger + timing spans for the bot's hot paths (router, extract, resolve, depletion, availability).
+# Configure from keys.env / the environment or call configure():
+#   LOG_LEVEL  - logging level for the "restaurant_bot" logger (default WARNING, so debug output costs nothing)
+#   TRACE_SPANS - "1" to time spans (default off: span() returns a shared no-op context manager)
+#   SPAN_LOG   - path of a JSONL file to append one {"span", "ms", "ts", ...} record per finished span
+
+logger = logging.getLogger("restaurant_bot")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+logger.setLevel(os.getenv("LOG_LEVEL", "WARNING").upper())
+
+_NULL_SPAN = nullcontext()
+_enabled = os.getenv("TRACE_SPANS", "0").lower() in {"1", "true", "yes", "on"}
+_span_log = os.getenv("SPAN_LOG") or None
+_listeners = []
+_write_lock = threading.Lock()
+
+
+def configure(level=None, spans=None, span_log=None):
+    """Change the log level, turn span timing on/off, or set the JSONL export path ("" disables export)."""
+    global _enabled, _span_log
+    if level is not None:
+        logger.setLevel(level.upper() if isinstance(level, str) else level)
+    if spans is not None:
+        _enabled = bool(spans)
+    if span_log is not None:
+        _span_log = span_log or None
+        if _span_log:
+            _enabled = True
+
+
+def spans_enabled():
+    return _enabled
+
+
+def add_span_listener(listener):
+    """listener(record) is called with every finished span record (a dict) while spans are enabled."""
+    _listeners.append(listener)
+
+
+def remove_span_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+class _Span:
+    __slots__ = ("name", "fields", "start")
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record = {"span": self.name, "ms": round((time.perf_counter() - self.start) * 1000, 3), "ts": time.time()}
+        record.update(self.fields)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        _emit(record)
+        return False
+
+
+def span(name, **fields):
+    """
+    `with span("resolve", items=3):` - times the block when spans are enabled. Disabled, it returns
+    one shared no-op context manager, so instrumented code pays a function call and a flag check.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, fields)
+
+
+def _emit(record):
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("span %s took %.3f ms", record["span"], record["ms"])
+    for listener in list(_listeners):
+        listener(record)
+    if _span_log:
+        try:
+            line = json.dumps(record, default=str)
+            directory = os.path.dirname(_span_log)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with _write_lock, open(_span_log, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as err:
+            logger.warning("could not write span record to %s: %s", _span_log, err)
+
+
+# --- Per-context counters (DB round trips, embedding calls, ...) ---
+# incr() is a no-op unless a collect_counts() block is active in the current context.
+_counters = ContextVar("restaurant_bot_counters", default=None)
+
+
+def incr(name, n=1):
+    counts = _counters.get()
+    if counts is not None:
+        counts[name] = counts.get(name, 0) + n
+
+
+def counting():
+    return _counters.get() is not None
+
+
+@contextmanager
+def collect_counts():
+    """`with collect_counts() as counts:` - counts is a dict filled by incr() calls made inside the block."""
+    counts = {}
+    token = _counters.set(counts)
+    try:
+        yield counts
+    finally:
+        _counters.reset(token)
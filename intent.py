@@ -0,0 +1,141 @@
+import asyncio
+import re
+import numpy as np
+
+from menu_index import normalize_name
+
+# Cheap local routing ahead of routerChain. Labels match the router prompt: "extract" / "conversation".
+
+EXTRACT_PATTERNS = [
+    r"\b(i want|i'd like|i would like|i'll (take|have)|i will (take|have)|can i (get|have)|could i (get|have)|may i have)\b",
+    r"\b(give me|get me|bring me|order me|add|i need)\b",
+    r"\b(remove|delete|cancel|drop|take off|change|make it|replace|instead of)\b",
+    r"^(\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten)\s+\w+",
+]
+
+CONVERSATION_PATTERNS = [
+    r"^(hi|hello|hey|hiya|good (morning|afternoon|evening)|thanks|thank you|bye)\b[\s!.]*$",
+    r"\b(menu|recommend|suggest|suggestion|options|specials)\b",
+    r"^(what|which|do you|does|is|are|how|why|when|where|who|tell me|show me|list|can you (tell|show|list|recommend|suggest))\b",
+    r"\?\s*$",
+    r"\b(my order|my cart|ordered so far|order summary)\b",
+]
+
+# seed utterances for the nearest-centroid fallback (router prompt examples + typical traffic)
+DEFAULT_EXAMPLES = {
+    "extract": [
+        "I want a burger and fries",
+        "I want ice cream",
+        "Cancel that pizza",
+        "I'd like to order a pepperoni pizza",
+        "Can I get two butter chicken and a garlic naan",
+        "Remove the lassi from my order",
+        "Make that three masala dosa",
+        "Add one more paneer tikka",
+        "I'll have the chicken biryani with extra raita",
+        "Give me a mango lassi",
+    ],
+    "conversation": [
+        "Hello",
+        "What types of burgers do you have?",
+        "What have I ordered so far?",
+        "Suggest a meal with an appetizer and a side. I like spicy food",
+        "Show me the menu",
+        "What vegetarian options do you have?",
+        "Do you have any desserts?",
+        "Which dishes are spicy?",
+        "What's your cheapest appetizer?",
+        "Can you tell me your vegan options?",
+    ],
+}
+
+
+class IntentClassifier:
+    """
+    Local intent router: keyword/regex rules first, then a nearest-centroid model over (cached)
+    sentence embeddings of seed utterances. classify() returns a label only when confident;
+    otherwise label is None and the caller should fall back to routerChain.
+    """
+
+    def __init__(self, embedder=None, menu_index=None, examples=DEFAULT_EXAMPLES, min_similarity=0.45, min_margin=0.15):
+        self.embedder = embedder
+        self.menu_index = menu_index
+        self.examples = examples
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.extract_res = [re.compile(p) for p in EXTRACT_PATTERNS]
+        self.conversation_res = [re.compile(p) for p in CONVERSATION_PATTERNS]
+        self._labels = None
+        self._centroids = None
+        self._max_words = None
+
+    def _mentions_menu_item(self, text):
+        """True if some run of words in text is a menu item or alias ("2 garlic naan", "i want butter chicken")."""
+        if self.menu_index is None:
+            return False
+        if self._max_words is None:
+            names = list(self.menu_index.names) + list(self.menu_index.aliases)
+            self._max_words = max((len(str(n).split()) for n in names), default=0)
+        words = [w.strip(".,!?;:") for w in text.split()]
+        for n in range(min(self._max_words, len(words)), 0, -1):
+            for i in range(len(words) - n + 1):
+                span = " ".join(words[i:i + n])
+                if span and self.menu_index.resolve(span) is not None:
+                    return True
+        return False
+
+    def rule_label(self, text):
+        """
+        'extract' only when the text names something on the menu and no conversation rule fires;
+        'conversation' when only conversation rules fire; else None. Order verbs or a leading number
+        on their own ("i need help", "a table for two") are not enough to skip the router.
+        """
+        text = normalize_name(text)
+        order_words = any(r.search(text) for r in self.extract_res)
+        conversation = any(r.search(text) for r in self.conversation_res)
+        if conversation:
+            return "conversation" if not order_words else None
+        if self._mentions_menu_item(text):
+            return "extract"
+        return None
+
+    def _fit(self):
+        labels, centroids = [], []
+        for label, utterances in self.examples.items():
+            embs = np.asarray(self.embedder.embed_documents(utterances), dtype=np.float32)
+            embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+            centroid = embs.mean(axis=0)
+            labels.append(label)
+            centroids.append(centroid / np.linalg.norm(centroid))
+        self._labels, self._centroids = labels, np.vstack(centroids)
+
+    def centroid_label(self, text):
+        """(label or None, best cosine similarity) from the nearest-centroid model."""
+        if self.embedder is None:
+            return None, 0.0
+        if self._centroids is None:
+            self._fit()
+        q = np.asarray(self.embedder.embed_query(text), dtype=np.float32)
+        sims = self._centroids @ (q / np.linalg.norm(q))
+        order = np.argsort(-sims)
+        best = float(sims[order[0]])
+        margin = best - float(sims[order[1]]) if len(order) > 1 else best
+        if best >= self.min_similarity and margin >= self.min_margin:
+            return self._labels[order[0]], best
+        return None, best
+
+    def classify(self, text) -> dict:
+        label = self.rule_label(text)
+        if label is not None:
+            return {"label": label, "confidence": 1.0, "source": "rules"}
+        label, confidence = self.centroid_label(text)
+        if label is not None:
+            return {"label": label, "confidence": confidence, "source": "centroid"}
+        return {"label": None, "confidence": confidence, "source": None}
+
+    async def aclassify(self, text) -> dict:
+        """classify() for async callers: the rules run inline, the embedding step on a worker thread."""
+        label = self.rule_label(text)
+        if label is not None:
+            return {"label": label, "confidence": 1.0, "source": "rules"}
+        return await asyncio.to_thread(self.classify, text)
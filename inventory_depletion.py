@@ -1,48 +1,99 @@
 import mysql.connector
 import json
 from datetime import datetime
-from dotenv import load_dotenv
-import os
 from decimal import Decimal # Import Decimal to handle database types correctly
-load_dotenv()
 # Corrected: Import Item from Classes.py
 from Classes import Item # Assuming Item class is defined in Classes.py
-
-# --- IMPORTANT: MySQL DB_CONFIG for inventory_depletion.py ---
-# Ensure these details match your 'restaurant_new_db' setup.
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',        # Your MySQL username
-    'password': '12345678', # Your MySQL password
-    'database': os.getenv('DB_NAME') # The database where 'Ingredients' and 'Recipe_Ingredients' tables are
-}
-# ----------------------------------------------------
+from db_pool import get_connection
+from instrumentation import logger
 
 def get_mysql_connection():
-    """Establishes and returns a connection to the MySQL database."""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except mysql.connector.Error as err:
-        print(f"Error connecting to MySQL: {err}")
-        print("Please ensure your MySQL server is running and connection details are correct.")
-        return None
+    """Checks out a connection from the shared pool (conn.close() returns it)."""
+    return get_connection()
 
-def deplete_inventory_from_order(order_data_items, conn):
+# Whole depletion in one statement: the order lines are staged as a derived table of
+# (meal_id, quantity) (SELECT %s, %s UNION ALL ...), joined to Recipe_Ingredients on the meal_id,
+# summed per ingredient and subtracted from Ingredients. NULL inventory counts as 0, like the
+# row-by-row mode.
+SET_BASED_DEPLETION_QUERY = """
+    UPDATE Ingredients i
+    JOIN (
+        SELECT ri.Ingredient_ID AS ingredient_id, SUM(o.quantity * ri.quantity) AS total_depletion
+        FROM ({order_lines}) o
+        JOIN Recipe_Ingredients ri ON ri.Meal_ID = o.meal_id
+        GROUP BY ri.Ingredient_ID
+    ) d ON i.ingredient_id = d.ingredient_id
+    SET i.current_inventory = COALESCE(i.current_inventory, 0) - d.total_depletion;
+"""
+
+def deplete_inventory_from_order(order_data_items, conn, mode="set", menu_index=None):
     """
     Depletes ingredients from the Ingredients table based on the confirmed order items.
     
     Args:
         order_data_items (list[Item]): A list of Item objects from the confirmed order.
         conn (mysql.connector.connection.MySQLConnection): An active MySQL database connection.
+        mode (str): "set" runs the whole depletion as one UPDATE ... JOIN statement (one round trip
+                    whatever the order size); "rows" is the original per-ingredient read/update loop.
+        menu_index (MenuIndex, optional): Shared menu index; in "set" mode the meal_ids come from it
+                                          instead of a Meals lookup.
     """
     if conn is None:
-        print("Error: MySQL connection not established. Cannot deplete inventory.")
+        logger.error("MySQL connection not established. Cannot deplete inventory.")
+        return False
+
+    if mode == "set":
+        return _deplete_set_based(order_data_items, conn, menu_index)
+    if mode != "rows":
+        raise ValueError(f"Unknown depletion mode: {mode!r}")
+    return _deplete_row_by_row(order_data_items, conn)
+
+def _deplete_set_based(order_data_items, conn, menu_index=None):
+    """Single UPDATE ... JOIN over the staged (meal_id, quantity) lines, committed as one transaction."""
+    items = [item for item in order_data_items if item.quantity]
+    if not items:
+        logger.info("No items in the order to deplete inventory.")
         return False
 
+    try:
+        with conn.cursor() as cursor:
+            if menu_index is not None:
+                meal_ids = {item.item_name.lower(): menu_index.meal_id(item.item_name) for item in items}
+            else:
+                names = list({item.item_name for item in items})
+                cursor.execute("SELECT name, meal_id FROM Meals WHERE name IN (%s);" % ', '.join(['%s'] * len(names)), tuple(names))
+                meal_ids = {name.lower(): meal_id for name, meal_id in cursor.fetchall()}
+            order_lines = []
+            for item in items:
+                meal_id = meal_ids.get(item.item_name.lower())
+                if meal_id is None:
+                    logger.debug("Could not find meal_id for '%s'. Skipping depletion for this item.", item.item_name)
+                    continue
+                order_lines.append((int(meal_id), item.quantity))
+            if not order_lines:
+                logger.info("No valid meal IDs found in the order to deplete inventory.")
+                return False
+
+            staged = " UNION ALL ".join(["SELECT %s AS meal_id, %s AS quantity"] + ["SELECT %s, %s"] * (len(order_lines) - 1))
+            params = tuple(value for line in order_lines for value in line)
+            cursor.execute(SET_BASED_DEPLETION_QUERY.format(order_lines=staged), params)
+            updated = cursor.rowcount
+        conn.commit()
+    except mysql.connector.Error as err:
+        logger.error("An error occurred during inventory depletion: %s", err)
+        conn.rollback() # Rollback changes if an error occurs
+        return False
+
+    if updated <= 0:
+        logger.info("No valid meal IDs found in the order to deplete inventory.")
+        return False
+    return True
+
+def _deplete_row_by_row(order_data_items, conn):
+    """Original implementation: reads the recipes into Python and updates one ingredient at a time."""
     try:
         with conn.cursor(dictionary=True) as cursor: # Use dictionary=True for easier access to column names
-            print("\n--- Starting inventory depletion from single order ---")
+            logger.debug("Starting inventory depletion for %d order lines", len(order_data_items))
             
             # Step 1: Get meal-ingredient relationships and current inventory for ordered items
             # This complex query aims to get all necessary info in one go
@@ -51,7 +102,7 @@ def deplete_inventory_from_order(order_data_items, conn):
             item_names_in_order = [item.item_name for item in order_data_items]
             
             if not item_names_in_order:
-                print("No items in the order to deplete inventory.")
+                logger.info("No items in the order to deplete inventory.")
                 return False
 
             # Fetch meal_ids for the ordered item_names
@@ -69,7 +120,7 @@ def deplete_inventory_from_order(order_data_items, conn):
                     meal_ids_in_order_set.add(meal_id)
             
             if not meal_ids_in_order_set:
-                print("No valid meal IDs found in the order to deplete inventory.")
+                logger.info("No valid meal IDs found in the order to deplete inventory.")
                 return False
 
             meal_ids_in_order_tuple = tuple(meal_ids_in_order_set)
@@ -103,10 +154,10 @@ def deplete_inventory_from_order(order_data_items, conn):
                 meal_id_for_item = meal_name_to_id_map.get(meal_name) # Get meal_id using the map
 
                 if not meal_id_for_item:
-                    print(f"DEBUG: Could not find meal_id for '{meal_name}'. Skipping depletion for this item.")
+                    logger.debug("Could not find meal_id for '%s'. Skipping depletion for this item.", meal_name)
                     continue
 
-                print(f"DEBUG: Processing order for '{meal_name}' (Quantity: {ordered_quantity})")
+                logger.debug("Processing order for '%s' (Quantity: %s)", meal_name, ordered_quantity)
 
                 # Filter recipe_details for the current meal
                 meal_recipe_ingredients = [
@@ -115,7 +166,7 @@ def deplete_inventory_from_order(order_data_items, conn):
                 ]
                 
                 if not meal_recipe_ingredients:
-                    print(f"DEBUG: No recipe ingredients found for Meal ID {meal_id_for_item} ('{meal_name}'). Skipping.")
+                    logger.debug("No recipe ingredients found for Meal ID %s ('%s'). Skipping.", meal_id_for_item, meal_name)
                     continue
 
                 for ingredient_detail in meal_recipe_ingredients:
@@ -148,13 +199,10 @@ def deplete_inventory_from_order(order_data_items, conn):
                 total_depletion_amount = data['total_depletion']
                 recipe_unit = data['unit']
 
-                print(f"Depleting inventory for '{ingredient_name}':")
-                print(f"DEBUG:     Current Inventory: {current_inventory:.2f} {recipe_unit}") # Formatted for clarity
-                print(f"DEBUG:     Total Depletion Amount: {total_depletion_amount:.2f} {recipe_unit}") # Formatted for clarity
 
                 # Handle cases where current_inventory might be None (newly added ingredient not initialized)
                 if current_inventory is None:
-                    print(f"  - WARNING: Inventory for '{ingredient_name}' is NULL. Treating as 0 for depletion.")
+                    logger.warning("Inventory for '%s' is NULL. Treating as 0 for depletion.", ingredient_name)
                     current_inventory = 0.0
                 
                 new_inventory = current_inventory - total_depletion_amount
@@ -166,16 +214,132 @@ def deplete_inventory_from_order(order_data_items, conn):
                 WHERE ingredient_id = %s;
                 """
                 cursor.execute(update_inventory_query, (new_inventory, ingredient_id))
-                print(f"  - Depleted {total_depletion_amount:.2f} {recipe_unit} of '{ingredient_name}'. New inventory: {new_inventory:.2f} {recipe_unit}")
+                logger.debug("Depleted %.2f %s of '%s'. New inventory: %.2f %s", total_depletion_amount, recipe_unit, ingredient_name, new_inventory, recipe_unit)
         
         conn.commit()
-        print("Inventory depletion completed successfully.")
+        logger.debug("Inventory depletion completed successfully.")
         return True
 
     except mysql.connector.Error as err:
-        print(f"An error occurred during inventory depletion: {err}")
+        logger.error("An error occurred during inventory depletion: %s", err)
         conn.rollback() # Rollback changes if an error occurs
         return False
     except Exception as e:
-        print(f"An unexpected error occurred during inventory depletion: {e}")
+        logger.error("An unexpected error occurred during inventory depletion: %s", e)
         return False
+
+def reserve_stock(order_data_items, conn, commit=True):
+    """
+    Atomically reserves the ingredients for an order, line by line, without overselling.
+
+    The affected Ingredients rows are locked with SELECT ... FOR UPDATE in ingredient_id order
+    (so concurrent checkouts queue instead of deadlocking), each line is accepted only if every
+    ingredient still covers it, and the accepted total is applied as one relative decrement.
+    Rejected lines leave inventory untouched.
+
+    Args:
+        order_data_items (list[Item]): A list of Item objects from the confirmed order.
+        conn (mysql.connector.connection.MySQLConnection): An active MySQL database connection.
+        commit (bool): Commit the reservation. Pass False to keep the row locks and commit together
+                       with other writes (e.g. the Order_Items insert); the caller must commit or roll back.
+
+    Returns:
+        dict: "success" (bool), "accepted" (list[Item]), "rejected" (list[dict] with item_name, quantity,
+              reason and missing_ingredients), "depleted" ({ingredient_id: amount}),
+              "before" / "after" ({ingredient_id: {name, inventory, unit}}) and "error" (str, if any).
+    """
+    result = {"success": False, "accepted": [], "rejected": [], "depleted": {}, "before": {}, "after": {}}
+    if conn is None:
+        logger.error("MySQL connection not established. Cannot reserve stock.")
+        result["error"] = "MySQL connection not established."
+        return result
+
+    names = list({item.item_name for item in order_data_items})
+    if not names:
+        result["error"] = "No items in the order."
+        return result
+
+    try:
+        with conn.cursor(dictionary=True) as cursor:
+            cursor.execute("SELECT name, meal_id FROM Meals WHERE name IN (%s);" % ', '.join(['%s'] * len(names)), tuple(names))
+            meal_ids = {row['name'].lower(): row['meal_id'] for row in cursor.fetchall()}
+
+            recipes = {} # meal_id -> {ingredient_id: quantity per meal}
+            if meal_ids:
+                ids = tuple(set(meal_ids.values()))
+                cursor.execute(
+                    "SELECT Meal_ID, Ingredient_ID, quantity FROM Recipe_Ingredients WHERE Meal_ID IN (%s);" % ','.join(['%s'] * len(ids)),
+                    ids,
+                )
+                for row in cursor.fetchall():
+                    recipe = recipes.setdefault(row['Meal_ID'], {})
+                    recipe[row['Ingredient_ID']] = recipe.get(row['Ingredient_ID'], 0.0) + float(row['quantity'])
+
+            ingredient_ids = sorted({ing_id for recipe in recipes.values() for ing_id in recipe})
+            if ingredient_ids:
+                # consistent lock order across sessions -> no lock-order deadlocks
+                cursor.execute(
+                    "SELECT ingredient_id, ingredient_name, current_inventory, unit FROM Ingredients "
+                    "WHERE ingredient_id IN (%s) ORDER BY ingredient_id FOR UPDATE;" % ','.join(['%s'] * len(ingredient_ids)),
+                    tuple(ingredient_ids),
+                )
+                for row in cursor.fetchall():
+                    inventory = row['current_inventory']
+                    result["before"][row['ingredient_id']] = {
+                        "name": row['ingredient_name'],
+                        "inventory": float(inventory) if inventory is not None else None,
+                        "unit": row['unit'],
+                    }
+
+            remaining = {ing_id: (data["inventory"] or 0.0) for ing_id, data in result["before"].items()}
+            depleted = {}
+            for item in order_data_items:
+                meal_id = meal_ids.get(item.item_name.lower())
+                if meal_id is None:
+                    result["rejected"].append({"item_name": item.item_name, "quantity": item.quantity, "reason": "unknown item", "missing_ingredients": []})
+                    continue
+                needed = {ing_id: item.quantity * qty for ing_id, qty in recipes.get(meal_id, {}).items()}
+                missing = [
+                    {
+                        "ingredient_name": result["before"].get(ing_id, {}).get("name", str(ing_id)),
+                        "needed": amount - remaining.get(ing_id, 0.0),
+                        "unit": result["before"].get(ing_id, {}).get("unit"),
+                    }
+                    for ing_id, amount in needed.items()
+                    if amount > remaining.get(ing_id, 0.0)
+                ]
+                if missing:
+                    result["rejected"].append({"item_name": item.item_name, "quantity": item.quantity, "reason": "insufficient stock", "missing_ingredients": missing})
+                    continue
+                for ing_id, amount in needed.items():
+                    remaining[ing_id] = remaining.get(ing_id, 0.0) - amount
+                    depleted[ing_id] = depleted.get(ing_id, 0.0) + amount
+                result["accepted"].append(item)
+
+            if depleted:
+                # relative decrement on the locked rows, one statement for every ingredient
+                cases = " ".join(["WHEN %s THEN %s"] * len(depleted))
+                params = [value for ing_id, amount in depleted.items() for value in (ing_id, amount)]
+                params += list(depleted)
+                placeholders = ','.join(['%s'] * len(depleted))
+                cursor.execute(
+                    f"UPDATE Ingredients SET current_inventory = COALESCE(current_inventory, 0) - CASE ingredient_id {cases} END "
+                    f"WHERE ingredient_id IN ({placeholders});",
+                    tuple(params),
+                )
+
+        if commit:
+            conn.commit()
+    except mysql.connector.Error as err:
+        logger.error("An error occurred while reserving stock: %s", err)
+        conn.rollback() # releases the row locks
+        result.update({"accepted": [], "depleted": {}, "error": f"MySQL Error: {err}"})
+        return result
+
+    result["depleted"] = depleted
+    result["after"] = {
+        ing_id: {**data, "inventory": remaining[ing_id] if ing_id in depleted else data["inventory"]}
+        for ing_id, data in result["before"].items()
+    }
+    result["success"] = bool(result["accepted"])
+    return result
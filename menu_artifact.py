@@ -0,0 +1,371 @@
+"""
+Compiled menu artifact: everything the bot derives from the menu, built once offline.
+
+    python menu_artifact.py compile [--menu sqldatafiles/meals_new.csv] [--out build/menu_artifact] [--no-db]
+    python menu_artifact.py info [--out build/menu_artifact]
+
+The artifact is a directory holding manifest.json plus one .npy file per array: the menu columns,
+normalized names, alias map, trigram postings (CSR), the BM25 weight matrix (CSR), the name and
+retriever-document embedding matrices, and the recipe/ingredient arrays from MySQL. Bot processes
+open it with load_artifact(), which memory-maps the arrays read-only, so startup skips CSV parsing,
+index building and embedding the menu, and every process on the host shares the same pages.
+
+The manifest's `version` hashes the menu CSV, the alias table, the embedding model and the format,
+so load_artifact() refuses (returns None) an artifact compiled from a different menu and the bot
+falls back to building everything from the CSV. The recipe arrays come from MySQL, so the manifest
+also stores recipe_marker(), a cheap change marker for the recipe tables (row counts, max ids and
+InnoDB UPDATE_TIME); AvailabilityEngine.from_artifact() compares it against the live tables and
+reloads recipes from MySQL when they have changed since the compile.
+
+A directory rather than one archive file: np.load can only memory-map standalone .npy files (members
+of an .npz are read into memory), and compile_menu() still publishes it atomically by renaming the
+finished directory into place.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import mysql.connector
+import numpy as np
+import pandas as pd
+
+from instrumentation import logger
+from menu_index import ALIASES_PATH, MenuIndex, load_aliases, normalize_name
+from searchers import BM25Index, TrigramIndex, normalize_rows
+
+FORMAT_VERSION = 3
+MENU_PATH = "sqldatafiles/meals_new.csv"
+ARTIFACT_PATH = os.getenv("MENU_ARTIFACT", "build/menu_artifact")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+def _sha256(path):
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def source_version(menu_path=MENU_PATH, aliases_path=ALIASES_PATH, embedding_model=EMBEDDING_MODEL):
+    """Content hash identifying an artifact built from these inputs."""
+    h = hashlib.sha256()
+    for part in (str(FORMAT_VERSION), _sha256(menu_path), _sha256(aliases_path), embedding_model):
+        h.update(str(part).encode())
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+def _pack_strings(strings):
+    """UTF-8 blob + int64 offsets, so a string table can be memory-mapped like any other array."""
+    encoded = [str(s).encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob, offsets):
+    data = blob.tobytes()
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+class _Writer:
+    def __init__(self, path):
+        self.path = path
+        self.arrays = {}
+
+    def array(self, name, arr, dtype=None):
+        arr = np.ascontiguousarray(arr, dtype=dtype)
+        np.save(os.path.join(self.path, f"{name}.npy"), arr, allow_pickle=False)
+        self.arrays[name] = {"dtype": str(arr.dtype), "shape": list(arr.shape)}
+
+    def strings(self, name, strings):
+        blob, offsets = _pack_strings(strings)
+        self.array(f"{name}.blob", blob)
+        self.array(f"{name}.offsets", offsets)
+
+
+def _recipe_rows(conn):
+    """Meals and recipe lines from MySQL (the same shape AvailabilityEngine.reload() reads)."""
+    with conn.cursor(dictionary=True) as cursor:
+        cursor.execute("SELECT meal_id, name AS meal_name FROM Meals;")
+        meals = cursor.fetchall()
+        cursor.execute("""
+            SELECT ri.Meal_ID AS meal_id, i.ingredient_id, ri.quantity AS required_quantity, i.ingredient_name, i.unit
+            FROM Recipe_Ingredients ri
+            JOIN Ingredients i ON ri.Ingredient_ID = i.ingredient_id
+            ORDER BY ri.Meal_ID, i.ingredient_id
+        """)
+        return meals, cursor.fetchall()
+
+
+# one round trip of index-only aggregates; UPDATE_TIME is left out for Ingredients, whose
+# inventory column changes on every checkout
+_RECIPE_MARKER_QUERY = """
+    SELECT (SELECT COUNT(*) FROM Meals), (SELECT MAX(meal_id) FROM Meals),
+           (SELECT COUNT(*) FROM Recipe_Ingredients), (SELECT MAX(Meal_ID) FROM Recipe_Ingredients),
+           (SELECT COUNT(*) FROM Ingredients), (SELECT MAX(ingredient_id) FROM Ingredients),
+           (SELECT MAX(UPDATE_TIME) FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ('Meals', 'Recipe_Ingredients'));
+"""
+
+
+def recipe_marker(conn):
+    """{"rows": counts and max ids of the recipe tables, "update_time": last write to Meals/Recipe_Ingredients or None}."""
+    with conn.cursor() as cursor:
+        cursor.execute(_RECIPE_MARKER_QUERY)
+        *rows, update_time = cursor.fetchone()
+    return {"rows": [None if v is None else int(v) for v in rows],
+            "update_time": None if update_time is None else str(update_time)}
+
+
+def _recipes_changed(compiled, live):
+    if compiled["rows"] != live["rows"]:
+        return True
+    # InnoDB keeps UPDATE_TIME in memory only: NULL after a server restart means "no write since"
+    return live["update_time"] is not None and live["update_time"] != compiled["update_time"]
+
+
+def compile_menu(out=ARTIFACT_PATH, menu_path=MENU_PATH, aliases_path=ALIASES_PATH, embedder=None,
+                 embedding_model=EMBEDDING_MODEL, conn=None):
+    """
+    Build the artifact for menu_path into `out`. embedder=None skips the embedding matrices
+    (the bot then embeds the menu at startup as before); conn=None skips the recipe arrays.
+    The directory is written next to `out` and swapped in at the end, so readers never see a
+    half-written artifact. Returns the manifest.
+    """
+    start = time.perf_counter()
+    menu = pd.read_csv(menu_path)
+    aliases = load_aliases(aliases_path)
+    menu_index = MenuIndex(menu, aliases=aliases)
+    names = menu["item_name"].astype(str).tolist()
+    lower = [n.lower() for n in names] # what MultiSearch/TrigramIndex match against
+
+    tmp = f"{out.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    w = _Writer(tmp)
+
+    columns = []
+    for col in menu.columns:
+        if pd.api.types.is_numeric_dtype(menu[col]):
+            w.array(f"menu.{col}", menu[col].to_numpy())
+            columns.append({"name": col, "kind": "numeric"})
+        else:
+            values = menu[col]
+            w.strings(f"menu.{col}", values.fillna("").astype(str))
+            w.array(f"menu.{col}.null", values.isna().to_numpy())
+            columns.append({"name": col, "kind": "string"})
+    w.strings("names.normalized", [normalize_name(n) for n in names])
+
+    grams, indptr, indices = TrigramIndex(lower).to_arrays()
+    w.strings("trigram.grams", grams)
+    w.array("trigram.indptr", indptr)
+    w.array("trigram.indices", indices)
+
+    terms, data, bm_indices, bm_indptr, shape = BM25Index.from_menu(menu).to_arrays()
+    w.strings("bm25.terms", terms)
+    w.array("bm25.data", data)
+    w.array("bm25.indices", bm_indices)
+    w.array("bm25.indptr", bm_indptr)
+
+    if embedder is not None:
+        from utils import menu_documents # imports langchain; only needed when embedding
+        w.array("embeddings.names", normalize_rows(embedder.embed_documents(names)), dtype=np.float32)
+        docs = [d.page_content for d in menu_documents(menu)]
+        w.array("embeddings.documents", embedder.embed_documents(docs), dtype=np.float32)
+
+    recipes = None
+    if conn is not None:
+        meals, rows = _recipe_rows(conn)
+        w.array("recipe.meal_ids", [m["meal_id"] for m in meals], dtype=np.int64)
+        w.strings("recipe.meal_names", [m["meal_name"] for m in meals])
+        w.array("recipe.line_meal_ids", [r["meal_id"] for r in rows], dtype=np.int64)
+        w.array("recipe.line_ingredient_ids", [r["ingredient_id"] for r in rows], dtype=np.int64)
+        w.array("recipe.line_quantities", [float(r["required_quantity"] or 0) for r in rows], dtype=np.float64)
+        ingredients = {r["ingredient_id"]: (r["ingredient_name"], r["unit"]) for r in rows}
+        ids = sorted(ingredients)
+        w.array("ingredient.ids", ids, dtype=np.int64)
+        w.strings("ingredient.names", [ingredients[i][0] or "" for i in ids])
+        w.strings("ingredient.units", [ingredients[i][1] or "" for i in ids])
+        recipes = {"meals": len(meals), "lines": len(rows), "ingredients": len(ids),
+                   "marker": recipe_marker(conn)}
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": source_version(menu_path, aliases_path, embedding_model if embedder is not None else None),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": {"menu": menu_path, "menu_sha256": _sha256(menu_path),
+                   "aliases": aliases_path, "aliases_sha256": _sha256(aliases_path)},
+        "embedding_model": embedding_model if embedder is not None else None,
+        "items": len(names),
+        "columns": columns,
+        # normalized alias -> item name, as resolved by MenuIndex (unknown targets already dropped)
+        "aliases": {alias: names[pos] for alias, pos in menu_index.aliases.items()},
+        "bm25_shape": list(shape),
+        "recipes": recipes,
+        "arrays": w.arrays,
+    }
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # swap in; processes still mapping the old files keep their (unlinked) pages
+    if os.path.exists(out):
+        old = f"{out.rstrip(os.sep)}.old-{os.getpid()}"
+        os.replace(out, old)
+        os.replace(tmp, out)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        os.replace(tmp, out)
+    logger.info("compiled menu artifact %s (%d items) in %.2f s", manifest["version"], len(names), time.perf_counter() - start)
+    return manifest
+
+
+class MenuArtifact:
+    """Read-only view of a compiled artifact; arrays are memory-mapped on first access."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest["version"]
+        self._arrays = {}
+
+    def __contains__(self, name):
+        return name in self.manifest["arrays"]
+
+    def array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+        return self._arrays[name]
+
+    def strings(self, name):
+        return _unpack_strings(self.array(f"{name}.blob"), self.array(f"{name}.offsets"))
+
+    def menu_df(self):
+        """The menu table (same columns and values as the CSV it was compiled from)."""
+        data = {}
+        for col in self.manifest["columns"]:
+            name = col["name"]
+            if col["kind"] == "numeric":
+                data[name] = np.asarray(self.array(f"menu.{name}"))
+            else:
+                values = pd.Series(self.strings(f"menu.{name}"), dtype=object)
+                values[np.asarray(self.array(f"menu.{name}.null"))] = np.nan
+                data[name] = values
+        return pd.DataFrame(data)
+
+    def aliases(self):
+        return dict(self.manifest["aliases"])
+
+    def menu_index(self, menu_df=None):
+        return MenuIndex(menu_df if menu_df is not None else self.menu_df(), aliases=self.aliases())
+
+    def trigram_index(self):
+        names = [s.lower() for s in self.strings("menu.item_name")]
+        return TrigramIndex.from_arrays(names, self.strings("trigram.grams"),
+                                        self.array("trigram.indptr"), self.array("trigram.indices"))
+
+    def bm25(self):
+        return BM25Index.from_arrays(self.strings("bm25.terms"), self.array("bm25.data"), self.array("bm25.indices"),
+                                     self.array("bm25.indptr"), self.manifest["bm25_shape"])
+
+    def name_embeddings(self):
+        """Row-normalized name embeddings (float32, memory-mapped), or None if compiled without an embedder."""
+        return self.array("embeddings.names") if "embeddings.names" in self else None
+
+    def document_embeddings(self):
+        """Embeddings of utils.menu_documents(menu), or None if compiled without an embedder."""
+        return self.array("embeddings.documents") if "embeddings.documents" in self else None
+
+    def has_recipes(self):
+        return self.manifest.get("recipes") is not None
+
+    def recipes_current(self, conn):
+        """True if the recipe tables still match the compiled recipe arrays (False if they can't be checked)."""
+        try:
+            return not _recipes_changed(self.manifest["recipes"]["marker"], recipe_marker(conn))
+        except (mysql.connector.Error, KeyError, TypeError) as err:
+            logger.warning("could not check menu artifact recipes: %s", err)
+            return False
+
+    def recipe_rows(self):
+        """(meals, recipe rows without current_inventory) in AvailabilityEngine.load() shape."""
+        meals = [{"meal_id": int(m), "meal_name": n}
+                 for m, n in zip(self.array("recipe.meal_ids"), self.strings("recipe.meal_names"))]
+        ingredients = {int(i): (n, u) for i, n, u in zip(self.array("ingredient.ids"), self.strings("ingredient.names"),
+                                                         self.strings("ingredient.units"))}
+        rows = []
+        for meal_id, ing_id, qty in zip(self.array("recipe.line_meal_ids"), self.array("recipe.line_ingredient_ids"),
+                                        self.array("recipe.line_quantities")):
+            name, unit = ingredients[int(ing_id)]
+            rows.append({"meal_id": int(meal_id), "ingredient_id": int(ing_id), "required_quantity": float(qty),
+                         "ingredient_name": name, "unit": unit})
+        return meals, rows
+
+
+def load_artifact(path=ARTIFACT_PATH, menu_path=MENU_PATH, aliases_path=ALIASES_PATH, embedding_model=EMBEDDING_MODEL):
+    """The artifact at `path` if it was compiled from the current inputs, else None."""
+    if not os.path.exists(os.path.join(path, "manifest.json")):
+        return None
+    try:
+        artifact = MenuArtifact(path)
+    except (OSError, ValueError, KeyError) as err:
+        logger.warning("menu artifact %s unreadable: %s", path, err)
+        return None
+    if artifact.manifest.get("format") != FORMAT_VERSION:
+        logger.warning("menu artifact %s has format %s, expected %s; rebuilding from CSV",
+                       path, artifact.manifest.get("format"), FORMAT_VERSION)
+        return None
+    # an artifact compiled without embeddings has no model in its version; compare against that
+    model = embedding_model if artifact.manifest.get("embedding_model") else None
+    if artifact.version != source_version(menu_path, aliases_path, model):
+        logger.warning("menu artifact %s is stale (menu or aliases changed); run `python menu_artifact.py compile`", path)
+        return None
+    return artifact
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", choices=["compile", "info"])
+    ap.add_argument("--menu", default=MENU_PATH)
+    ap.add_argument("--aliases", default=ALIASES_PATH)
+    ap.add_argument("--out", default=ARTIFACT_PATH)
+    ap.add_argument("--model", default=EMBEDDING_MODEL)
+    ap.add_argument("--no-embeddings", action="store_true", help="skip the embedding matrices (no model download)")
+    ap.add_argument("--no-db", action="store_true", help="skip the recipe/ingredient arrays")
+    args = ap.parse_args()
+
+    if args.command == "info":
+        artifact = MenuArtifact(args.out)
+        current = load_artifact(args.out, args.menu, args.aliases, args.model) is not None
+        print(json.dumps({k: v for k, v in artifact.manifest.items() if k not in ("arrays", "aliases")}, indent=2))
+        print(f"current: {current}")
+        return
+
+    embedder = None
+    if not args.no_embeddings:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        from embedding_cache import CachedEmbeddings
+        embedder = CachedEmbeddings(HuggingFaceEmbeddings(model_name=args.model), model_name=args.model)
+
+    if args.no_db:
+        manifest = compile_menu(args.out, args.menu, args.aliases, embedder, args.model)
+    else:
+        from db_pool import connection
+        with connection() as conn:
+            if conn is None:
+                print("Database unavailable; compiling without recipe arrays (use --no-db to silence).", file=sys.stderr)
+            manifest = compile_menu(args.out, args.menu, args.aliases, embedder, args.model, conn=conn)
+    print(f"menu artifact {manifest['version']}: {manifest['items']} items -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
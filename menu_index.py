@@ -0,0 +1,105 @@
+import os
+import re
+import pandas as pd
+
+from instrumentation import logger
+
+ALIASES_PATH = "sqldatafiles/menu_aliases.csv"
+
+
+def normalize_name(name):
+    """Lowercase, trim and collapse whitespace so lookups ignore casing/spacing differences."""
+    return re.sub(r"\s+", " ", str(name).strip().lower())
+
+
+def load_aliases(path=ALIASES_PATH):
+    """Read an alias table (columns: alias, item_name). Returns {} if the file does not exist."""
+    if not os.path.exists(path):
+        return {}
+    df = pd.read_csv(path)
+    return dict(zip(df["alias"], df["item_name"]))
+
+
+class MenuIndex:
+    """
+    Hash index over the menu, shared by the searchers, nodes and DB helpers.
+    Maps a normalized item name (or a registered alias, e.g. "chai" -> "Masala Chai")
+    to its row, meal_id and price in O(1), instead of masking the DataFrame or re-querying Meals.
+    `version` is bumped whenever the aliases or the set of unavailable meals change,
+    so caches keyed on it invalidate automatically.
+    """
+
+    def __init__(self, menu_df, aliases=None):
+        self.menu_df = menu_df
+        self.names = menu_df["item_name"].tolist()
+        self.meal_ids = menu_df["meal_id"].tolist() if "meal_id" in menu_df else [None] * len(self.names)
+        self.prices = menu_df["price"].tolist() if "price" in menu_df else [None] * len(self.names)
+
+        self.rows = {}
+        for pos, name in enumerate(self.names):
+            self.rows.setdefault(normalize_name(name), pos)
+
+        self.aliases = {}
+        self.unavailable = frozenset()
+        self.version = 0
+        for alias, target in (aliases or {}).items():
+            self.add_alias(alias, target)
+
+    @classmethod
+    def from_csv(cls, menu_path, aliases_path=ALIASES_PATH):
+        return cls(pd.read_csv(menu_path), aliases=load_aliases(aliases_path))
+
+    def add_alias(self, alias, item_name):
+        """Register shorthand for a menu item. Unknown targets are ignored with a warning."""
+        pos = self.rows.get(normalize_name(item_name))
+        if pos is None:
+            logger.warning("Alias '%s' points to unknown menu item '%s'. Skipping.", alias, item_name)
+            return
+        self.aliases[normalize_name(alias)] = pos
+        self.version += 1
+
+    def set_unavailable(self, names):
+        """Record which meals are currently unavailable; bumps `version` only if the set changed."""
+        unavailable = frozenset(normalize_name(n) for n in names)
+        if unavailable != self.unavailable:
+            self.unavailable = unavailable
+            self.version += 1
+
+    def is_available(self, name):
+        return normalize_name(name) not in self.unavailable
+
+    def lookup(self, name) -> dict:
+        """Exact (then alias) lookup. Returns the item's row info or {'found': False}."""
+        key = normalize_name(name)
+        match_type = "exact"
+        pos = self.rows.get(key)
+        if pos is None:
+            pos = self.aliases.get(key)
+            match_type = "alias"
+        if pos is None:
+            return {"found": False}
+        return {
+            "found": True,
+            "item": self.names[pos],
+            "row": pos,
+            "meal_id": self.meal_ids[pos],
+            "price": self.prices[pos],
+            "match_type": match_type,
+        }
+
+    def resolve(self, name):
+        """Canonical menu name for an exact name or alias, else None."""
+        pos = self.rows.get(normalize_name(name))
+        if pos is None:
+            pos = self.aliases.get(normalize_name(name))
+        return None if pos is None else self.names[pos]
+
+    def meal_id(self, name):
+        return self.lookup(name).get("meal_id")
+
+    def price(self, name):
+        return self.lookup(name).get("price")
+
+    def meal_name_to_id(self):
+        """{lowercased name: meal_id} for every menu item, same shape as the Meals query in db_utils."""
+        return {name.lower(): meal_id for name, meal_id in zip(self.names, self.meal_ids) if meal_id is not None}
@@ -1,48 +1,33 @@
-from Classes import State, Item
+import asyncio
+
+from Classes import State, Item, Order
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 from utils import get_context
 from langgraph.graph import StateGraph, START, END
 from langgraph.checkpoint.memory import MemorySaver
-import mysql.connector
-from dotenv import load_dotenv
-import os
+from db_pool import connection
 from db_utils import get_available_menu_meals, get_unavailable_meals
-
-load_dotenv("keys.env") # Load environment variables for DB_NAME
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',        # Your MySQL username
-    'password': '12345678', # Your MySQL password
-    'database': os.getenv('DB_NAME') # The database name from your .env file
-}
-
-# Establish MySQL connection for use within nodes.
-# This should ideally be a singleton or passed through the graph config.
-# For simplicity, establishing it here.
-_mysql_conn = None
-def get_db_connection():
-    global _mysql_conn
-    if _mysql_conn is None or not _mysql_conn.is_connected():
-        try:
-            _mysql_conn = mysql.connector.connect(**DB_CONFIG)
-            print("Successfully connected to MySQL database from nodes.py.")
-        except mysql.connector.Error as err:
-            print(f"Error connecting to MySQL from nodes.py: {err}")
-            _mysql_conn = None
-    return _mysql_conn
+from instrumentation import logger, span
+import speculation
 
 
-def router_node(state: State, routerChain):
+def router_node(state: State, routerChain, intent_classifier=None):
     """Routes user input to either order extraction or menu query."""
     messages = state["messages"]
     for m in messages[::-1]:
         if isinstance(m, HumanMessage):
             user_input = m.content
             break
-    response = routerChain.invoke({"user_input": [user_input]})
-    return {"internals": [response.content]}
-
-def extract_order_node(state: State, orderChain, parser):
+    # confident local classification skips the LLM round trip
+    with span("router"):
+        if intent_classifier is not None:
+            intent = intent_classifier.classify(user_input)
+            if intent["label"] is not None:
+                return {"internals": [intent["label"]]}
+        response = routerChain.invoke({"user_input": [user_input]})
+        return {"internals": [response.content]}
+
+def extract_order_node(state: State, orderChain, parser, order_parser=None):
     """Extracts structured order JSON from user input."""
     messages = state["messages"]
     cart = state["cart"]
@@ -50,63 +35,279 @@ def extract_order_node(state: State, orderChain, parser):
         if isinstance(m, HumanMessage):
             user_input = m.content
             break
+
+    with span("extract"):
+        # simple orders are parsed locally; only low-confidence input goes to the LLM
+        if order_parser is not None:
+            result = order_parser.parse(user_input)
+            if result is not None:
+                return {"internals": [AIMessage(content=result.model_dump_json(), name="extract")], "most_recent_order": result}
     
-    try:
-        result = orderChain.invoke({
-            "user_input": user_input,
-            "format_instructions": parser.get_format_instructions(),
-            "cart": cart
-        })
-        return {"internals": [AIMessage(content=result.model_dump_json(), name="extract")], "most_recent_order": result}
-    except Exception as e:
-        print("order parsing error!")
-        return {"messages": [AIMessage(content=f"Error parsing order: {str(e)}")]}
+        try:
+            result = orderChain.invoke({
+                "user_input": user_input,
+                "format_instructions": parser.get_format_instructions(),
+                "cart": cart
+            })
+            return {"internals": [AIMessage(content=result.model_dump_json(), name="extract")], "most_recent_order": result}
+        except Exception as e:
+            logger.warning("order parsing error: %s", e)
+            return {"messages": [AIMessage(content=f"Error parsing order: {str(e)}")]}
     
-def menu_query_node(state: State, conversationChain, retriever):
+# --- Async variants, for graphs run with ainvoke/astream (makegraph(use_async=True)) ---
+# LLM calls use ainvoke, blocking work (embeddings, MySQL) runs on worker threads, so one event
+# loop can serve many conversations while their model calls are in flight.
+
+async def arouter_node(state: State, routerChain, intent_classifier=None):
+    """router_node with a non-blocking router LLM call."""
+    messages = state["messages"]
+    for m in messages[::-1]:
+        if isinstance(m, HumanMessage):
+            user_input = m.content
+            break
+    with span("router"):
+        if intent_classifier is not None:
+            intent = await intent_classifier.aclassify(user_input)
+            if intent["label"] is not None:
+                return {"internals": [intent["label"]]}
+        response = await routerChain.ainvoke({"user_input": [user_input]})
+        return {"internals": [response.content]}
+
+async def aextract_order_node(state: State, orderChain, parser, order_parser=None):
+    """extract_order_node with a non-blocking extraction LLM call."""
+    messages = state["messages"]
+    cart = state["cart"]
+    for m in messages[::-1]:
+        if isinstance(m, HumanMessage):
+            user_input = m.content
+            break
+
+    with span("extract"):
+        if order_parser is not None:
+            result = order_parser.parse(user_input) # pure Python, fast enough to stay on the loop
+            if result is not None:
+                return {"internals": [AIMessage(content=result.model_dump_json(), name="extract")], "most_recent_order": result}
+
+        try:
+            result = await orderChain.ainvoke({
+                "user_input": user_input,
+                "format_instructions": parser.get_format_instructions(),
+                "cart": cart
+            })
+            return {"internals": [AIMessage(content=result.model_dump_json(), name="extract")], "most_recent_order": result}
+        except Exception as e:
+            logger.warning("order parsing error: %s", e)
+            return {"messages": [AIMessage(content=f"Error parsing order: {str(e)}")]}
+
+def _routed(label, extracted):
+    """Router output carrying an extraction already done: extract_order's updates, then the route label."""
+    update = dict(extracted)
+    update["internals"] = list(extracted.get("internals", [])) + [label]
+    return update
+
+def speculative_router_node(state: State, routerChain, orderChain, parser, intent_classifier=None, order_parser=None, guard=None):
+    """
+    router_node that, when the router LLM is needed, runs order extraction concurrently instead of
+    after it. On "extract" the extraction result is returned with the route (the graph goes straight
+    to delete_order); on "conversation" it is cancelled if not started yet, otherwise discarded.
+    guard (speculation.SpeculationGuard) decides per turn whether the extra call is worth it.
+    """
+    messages = state["messages"]
+    for m in messages[::-1]:
+        if isinstance(m, HumanMessage):
+            user_input = m.content
+            break
+    if intent_classifier is not None:
+        label = intent_classifier.classify(user_input)["label"]
+        if label == "extract":
+            return _routed(label, extract_order_node(state, orderChain, parser, order_parser))
+        if label is not None:
+            return {"internals": [label]}
+
+    speculate = guard is None or guard.should_speculate(user_input)
+    future = speculation.submit(extract_order_node, state, orderChain, parser, order_parser) if speculate else None
+    with span("router", speculative=speculate):
+        label = routerChain.invoke({"user_input": [user_input]}).content
+    route = label.strip().lower()
+    if guard is not None:
+        guard.record(route, speculate)
+    if route != "extract":
+        if future is not None:
+            future.cancel()
+        return {"internals": [label]}
+    return _routed(label, future.result() if future is not None else extract_order_node(state, orderChain, parser, order_parser))
+
+async def aspeculative_router_node(state: State, routerChain, orderChain, parser, intent_classifier=None, order_parser=None, guard=None):
+    """speculative_router_node for the async graph; a discarded extraction's request is cancelled."""
+    messages = state["messages"]
+    for m in messages[::-1]:
+        if isinstance(m, HumanMessage):
+            user_input = m.content
+            break
+    if intent_classifier is not None:
+        label = (await intent_classifier.aclassify(user_input))["label"]
+        if label == "extract":
+            return _routed(label, await aextract_order_node(state, orderChain, parser, order_parser))
+        if label is not None:
+            return {"internals": [label]}
+
+    speculate = guard is None or guard.should_speculate(user_input)
+    task = asyncio.create_task(aextract_order_node(state, orderChain, parser, order_parser)) if speculate else None
+    try:
+        with span("router", speculative=speculate):
+            label = (await routerChain.ainvoke({"user_input": [user_input]})).content
+    except BaseException:
+        if task is not None:
+            task.cancel()
+        raise
+    route = label.strip().lower()
+    if guard is not None:
+        guard.record(route, speculate)
+    if route != "extract":
+        if task is not None:
+            task.cancel()
+        return {"internals": [label]}
+    return _routed(label, await task if task is not None else await aextract_order_node(state, orderChain, parser, order_parser))
+
+def _routed_update(result):
+    """Graph updates for a RoutedOrder: the extraction (if any) followed by the route label."""
+    if result.intent != "extract":
+        return {"internals": [result.intent]}
+    order = result.order if result.order is not None else Order(items=[], delete=[], modify=[])
+    return _routed("extract", {"internals": [AIMessage(content=order.model_dump_json(), name="extract")], "most_recent_order": order})
+
+def routed_order_node(state: State, routedChain, parser, intent_classifier=None, order_parser=None):
+    """
+    Router and extractor in one LLM call (promptstore.routedOrderPrompt -> Classes.RoutedOrder).
+    On "extract" the order comes back with the route and the graph goes straight to delete_order.
+    Local shortcuts as in router_node/extract_order_node: a confident "conversation" or a locally
+    parsed order skips the LLM.
+    """
+    messages = state["messages"]
+    for m in messages[::-1]:
+        if isinstance(m, HumanMessage):
+            user_input = m.content
+            break
+    if intent_classifier is not None:
+        label = intent_classifier.classify(user_input)["label"]
+        if label == "conversation":
+            return {"internals": [label]}
+        if label == "extract" and order_parser is not None:
+            result = order_parser.parse(user_input)
+            if result is not None:
+                return _routed(label, {"internals": [AIMessage(content=result.model_dump_json(), name="extract")], "most_recent_order": result})
+
+    with span("route_extract"):
+        try:
+            result = routedChain.invoke({
+                "user_input": user_input,
+                "format_instructions": parser.get_format_instructions(),
+                "cart": state["cart"]
+            })
+        except Exception as e:
+            # same outcome as a failed extract_order_node
+            logger.warning("routed order parsing error: %s", e)
+            return {"messages": [AIMessage(content=f"Error parsing order: {str(e)}")], "internals": ["extract"]}
+        return _routed_update(result)
+
+async def arouted_order_node(state: State, routedChain, parser, intent_classifier=None, order_parser=None):
+    """routed_order_node for the async graph."""
+    messages = state["messages"]
+    for m in messages[::-1]:
+        if isinstance(m, HumanMessage):
+            user_input = m.content
+            break
+    if intent_classifier is not None:
+        label = (await intent_classifier.aclassify(user_input))["label"]
+        if label == "conversation":
+            return {"internals": [label]}
+        if label == "extract" and order_parser is not None:
+            result = order_parser.parse(user_input)
+            if result is not None:
+                return _routed(label, {"internals": [AIMessage(content=result.model_dump_json(), name="extract")], "most_recent_order": result})
+
+    with span("route_extract"):
+        try:
+            result = await routedChain.ainvoke({
+                "user_input": user_input,
+                "format_instructions": parser.get_format_instructions(),
+                "cart": state["cart"]
+            })
+        except Exception as e:
+            logger.warning("routed order parsing error: %s", e)
+            return {"messages": [AIMessage(content=f"Error parsing order: {str(e)}")], "internals": ["extract"]}
+        return _routed_update(result)
+
+def offload(node):
+    """Async node running the blocking node(state) on a worker thread (MySQL, embeddings, matching)."""
+    async def run(state: State):
+        return await asyncio.to_thread(node, state)
+    return run
+
+def _menu_answer_key(menu_index, availability):
+    return ("menu", menu_index.version if menu_index is not None else None,
+            availability.version if availability is not None else None)
+
+def menu_query_node(state: State, conversationChain, retriever, menu_index=None, response_cache=None, availability=None):
     """
     Answers questions about the menu, now showing both available and explicitly
     listing unavailable items.
+    The answer depends only on the menu and availability, not on the question's wording, so
+    response_cache (an LRUCache) holds it under the (menu_index, availability) versions: while
+    those are unchanged and the availability engine is fresh, no DB work is done.
     """
-    conn = get_db_connection() # Get the database connection
-    if conn and conn.is_connected():
-        available_meals = get_available_menu_meals(conn) 
-        unavailable_meals = get_unavailable_meals(conn)
-        menu_items_str = "" # Initialize empty string
-
-        if available_meals:
-            menu_items_str += "Our current menu includes:\n" # Corrected: Removed duplicate "Our current menu includes:"
-            for meal in available_meals:
-                menu_items_str += f"- {meal['meal_name']}\n"
+    if response_cache is not None and (availability is None or availability.is_fresh()):
+        cached = response_cache.get(_menu_answer_key(menu_index, availability))
+        if cached is not None:
+            return {"messages": [AIMessage(content=cached, name="menu_query")]}
+
+    with connection() as conn: # pooled connection, returned to the pool when the block exits
+        if conn and conn.is_connected():
+            with span("availability", source="menu_query"):
+                available_meals = get_available_menu_meals(conn, availability)
+                unavailable_meals = get_unavailable_meals(conn, availability)
+            if menu_index is not None:
+                menu_index.set_unavailable([meal['meal_name'] for meal in unavailable_meals])
+            menu_items_str = "" # Initialize empty string
+
+            if available_meals:
+                menu_items_str += "Our current menu includes:\n" # Corrected: Removed duplicate "Our current menu includes:"
+                for meal in available_meals:
+                    menu_items_str += f"- {meal['meal_name']}\n"
         
-        if unavailable_meals:
-            if available_meals: # Add a separator if there were available meals
-                menu_items_str += "\n"
-            menu_items_str += "Please note, the following meals are currently unavailable due to insufficient ingredients:\n"
-            for meal in unavailable_meals:
-                menu_items_str += f"- {meal['meal_name']}"
-                # Optionally, list the specific missing ingredients for more detail
-                # if meal['missing_ingredients']:
-                #     missing_detail = ", ".join([
-                #         f"{ing['ingredient_name']} (needed: {ing['needed']:.2f} {ing['unit']})"
-                #         for ing in meal['missing_ingredients']
-                #     ])
-                #     menu_items_str += f" (Missing: {missing_detail})"
-                menu_items_str += "\n"
+            if unavailable_meals:
+                if available_meals: # Add a separator if there were available meals
+                    menu_items_str += "\n"
+                menu_items_str += "Please note, the following meals are currently unavailable due to insufficient ingredients:\n"
+                for meal in unavailable_meals:
+                    menu_items_str += f"- {meal['meal_name']}"
+                    # Optionally, list the specific missing ingredients for more detail
+                    # if meal['missing_ingredients']:
+                    #     missing_detail = ", ".join([
+                    #         f"{ing['ingredient_name']} (needed: {ing['needed']:.2f} {ing['unit']})"
+                    #         for ing in meal['missing_ingredients']
+                    #     ])
+                    #     menu_items_str += f" (Missing: {missing_detail})"
+                    menu_items_str += "\n"
         
-        if not available_meals and not unavailable_meals:
-            menu_items_str = "I'm sorry, I can't retrieve the menu right now. Please try again later."
-        elif not available_meals and unavailable_meals:
-             # This case means only unavailable meals are known
-             menu_items_str += "\nIs there anything else I can help you with?" # Adjusted prompt
-        else: # Both available and possibly unavailable
-            menu_items_str += "\nWhat would you like to order?"
+            if not available_meals and not unavailable_meals:
+                menu_items_str = "I'm sorry, I can't retrieve the menu right now. Please try again later."
+            elif not available_meals and unavailable_meals:
+                 # This case means only unavailable meals are known
+                 menu_items_str += "\nIs there anything else I can help you with?" # Adjusted prompt
+            else: # Both available and possibly unavailable
+                menu_items_str += "\nWhat would you like to order?"
+
+            if response_cache is not None and (available_meals or unavailable_meals):
+                # stored under the versions current *after* this availability check
+                response_cache.put(_menu_answer_key(menu_index, availability), menu_items_str)
         
-        msg = AIMessage(content=menu_items_str, name="menu_query")
-        return {"messages": [msg]}
-    else:
-        error_msg = "I'm sorry, I can't fetch the menu right now. The database connection is not available."
-        print(f"Error in menu_query_node: {error_msg}")
-        return {"messages": [AIMessage(content=error_msg, name="menu_query_error")]}
+            msg = AIMessage(content=menu_items_str, name="menu_query")
+            return {"messages": [msg]}
+        else:
+            error_msg = "I'm sorry, I can't fetch the menu right now. The database connection is not available."
+            logger.error("menu_query_node: %s", error_msg)
+            return {"messages": [AIMessage(content=error_msg, name="menu_query_error")]}
 
 def routeFunc(state: State):
     internals = state["internals"]
@@ -115,7 +316,7 @@ def routeFunc(state: State):
     if last_m.strip().lower() in ["extract", "conversation","menu_query"]:
         return last_m.strip().lower()
     else:
-        print(f"unrecognized router output - {last_m}")
+        logger.warning("unrecognized router output - %s", last_m)
         return None
 
 # save static version
@@ -124,16 +325,24 @@ def routeFunc(state: State):
 
 import numpy as np
 from difflib import SequenceMatcher
+from searchers import EMB_CERTAIN, EMB_GOOD
 
 def cosine_similarity(query_emb, doc_embs):
     q = query_emb / np.linalg.norm(query_emb)
     d = doc_embs / np.linalg.norm(doc_embs, axis=1, keepdims=True)
     return np.dot(d, q)
 
-def modifyOrder(state: State, embedder, seq_thresh=0.6):
+def _clarify_cart_item(item_name, options, action):
+    """Chat message asking which cart line an ambiguous modify/delete meant, instead of blocking on input()."""
+    return AIMessage(f"We have the following options related to {item_name} in your cart -\n"
+                     + "\n".join(f"{i+1}. {opt}" for i, opt in enumerate(options))
+                     + f"\nWhich one would you like to {action}?")
+
+def modifyOrder(state: State, embedder, seq_thresh=0.6, menu_index=None):
     mro = state["most_recent_order"]
     cart = state["cart"]
     rej_items = []
+    new_messages = []
 
     def sequenceMatch(item_name, seq_threshold, items):
         item_lower = item_name.lower().strip()
@@ -152,8 +361,11 @@ def modifyOrder(state: State, embedder, seq_thresh=0.6):
         if not cart_names:
             continue
 
+        canonical = menu_index.resolve(item.item_name) if menu_index is not None else None
         if item.item_name.lower().strip() in [c.lower() for c in cart_names]:
             target_names = [item.item_name]
+        elif canonical is not None and canonical.lower() in [c.lower() for c in cart_names]:
+            target_names = [canonical]
         else:
             seq = sequenceMatch(item.item_name, seq_thresh, cart_names)
             query_emb = np.array(embedder.embed_query(item.item_name))
@@ -161,46 +373,24 @@ def modifyOrder(state: State, embedder, seq_thresh=0.6):
             sims = cosine_similarity(query_emb, cart_embs)
 
             certain_match_seq = [n for n, s in zip(seq["items"], seq["scores"]) if s >= 0.8]
-            certain_match_emb = [n for n, s in zip(cart_names, sims) if s >= 0.85]
+            certain_match_emb = [n for n, s in zip(cart_names, sims) if s >= EMB_CERTAIN]
             certain_set = list(set(certain_match_seq + certain_match_emb))
 
             if len(certain_set) == 1:
                 target_names = certain_set
             elif len(certain_set) > 1:
-                print(f"Multiple matches found for '{item.item_name}':")
-                for i, opt in enumerate(certain_set, 1):
-                    print(f"{i}. {opt}")
-                try:
-                    choice = int(input("Which one would you like to modify? ")) - 1
-                    if 0 <= choice < len(certain_set):
-                        target_names = [certain_set[choice]]
-                    else:
-                        print("Invalid choice. Skipping this item.")
-                        continue
-                except ValueError:
-                    print("Invalid input. Skipping this item.")
-                    continue
+                new_messages.append(_clarify_cart_item(item.item_name, certain_set, "modify"))
+                continue
             else:
                 good_match_seq = [n for n, s in zip(seq["items"], seq["scores"]) if s >= 0.6]
-                good_match_emb = [n for n, s in zip(cart_names, sims) if s >= 0.5]
+                good_match_emb = [n for n, s in zip(cart_names, sims) if s >= EMB_GOOD]
                 good_set = list(set(good_match_seq + good_match_emb))
 
                 if len(good_set) == 1:
                     target_names = good_set
                 elif len(good_set) > 1:
-                    print(f"Possible matches for '{item.item_name}':")
-                    for i, opt in enumerate(good_set, 1):
-                        print(f"{i}. {opt}")
-                    try:
-                        choice = int(input("Which one would you like to modify? ")) - 1
-                        if 0 <= choice < len(good_set):
-                            target_names = [good_set[choice]]
-                        else:
-                            print("Invalid choice. Skipping this item.")
-                            continue
-                    except ValueError:
-                        print("Invalid input. Skipping this item.")
-                        continue
+                    new_messages.append(_clarify_cart_item(item.item_name, good_set, "modify"))
+                    continue
                 else:
                     maxidx = np.argmax(sims)
                     rej_items.append((item.item_name, cart_names[maxidx]))
@@ -215,13 +405,14 @@ def modifyOrder(state: State, embedder, seq_thresh=0.6):
                         cart[i].modifiers.extend(item.modifiers)
                     break
 
-    return {"cart": cart, "rejected_items": rej_items}
+    return {"messages": new_messages, "cart": cart, "rejected_items": rej_items}
 
 
-def deleteOrder(state: State, embedder, seq_thresh=0.6):
+def deleteOrder(state: State, embedder, seq_thresh=0.6, menu_index=None):
     mro = state["most_recent_order"]
     cart = state["cart"]
     rej_items = []
+    new_messages = []
 
     # sequenceMatch function (pulled from MultiSearch)
     def sequenceMatch(item_name, seq_threshold, items):
@@ -241,9 +432,12 @@ def deleteOrder(state: State, embedder, seq_thresh=0.6):
         if not cart_names:
             continue
 
-        # 1. exact match
+        # 1. exact match (menu aliases resolve to the canonical cart name)
+        canonical = menu_index.resolve(item.item_name) if menu_index is not None else None
         if item.item_name.lower().strip() in [c.lower() for c in cart_names]:
             target_names = [item.item_name]
+        elif canonical is not None and canonical.lower() in [c.lower() for c in cart_names]:
+            target_names = [canonical]
         else:
             # 2. sequence matching
             seq = sequenceMatch(item.item_name, seq_thresh, cart_names)
@@ -255,46 +449,24 @@ def deleteOrder(state: State, embedder, seq_thresh=0.6):
 
             # classify matches
             certain_match_seq = [n for n, s in zip(seq["items"], seq["scores"]) if s >= 0.8]
-            certain_match_emb = [n for n, s in zip(cart_names, sims) if s >= 0.85]
+            certain_match_emb = [n for n, s in zip(cart_names, sims) if s >= EMB_CERTAIN]
             certain_set = list(set(certain_match_seq + certain_match_emb))
 
             if len(certain_set) == 1:
                 target_names = certain_set
             elif len(certain_set) > 1:
-                print(f"Multiple matches found for '{item.item_name}':")
-                for i, opt in enumerate(certain_set, 1):
-                    print(f"{i}. {opt}")
-                try:
-                    choice = int(input("Which one would you like to remove? ")) - 1
-                    if 0 <= choice < len(certain_set):
-                        target_names = [certain_set[choice]]
-                    else:
-                        print("Invalid choice. Skipping this item.")
-                        continue
-                except ValueError:
-                    print("Invalid input. Skipping this item.")
-                    continue
+                new_messages.append(_clarify_cart_item(item.item_name, certain_set, "remove"))
+                continue
             else:
                 good_match_seq = [n for n, s in zip(seq["items"], seq["scores"]) if s >= 0.6]
-                good_match_emb = [n for n, s in zip(cart_names, sims) if s >= 0.5]
+                good_match_emb = [n for n, s in zip(cart_names, sims) if s >= EMB_GOOD]
                 good_set = list(set(good_match_seq + good_match_emb))
 
                 if len(good_set) == 1:
                     target_names = good_set
                 elif len(good_set) > 1:
-                    print(f"Possible matches for '{item.item_name}':")
-                    for i, opt in enumerate(good_set, 1):
-                        print(f"{i}. {opt}")
-                    try:
-                        choice = int(input("Which one would you like to remove? ")) - 1
-                        if 0 <= choice < len(good_set):
-                            target_names = [good_set[choice]]
-                        else:
-                            print("Invalid choice. Skipping this item.")
-                            continue
-                    except ValueError:
-                        print("Invalid input. Skipping this item.")
-                        continue
+                    new_messages.append(_clarify_cart_item(item.item_name, good_set, "remove"))
+                    continue
                 else:
                     # rejection case → suggest closest by embedding
                     maxidx = np.argmax(sims)
@@ -314,11 +486,11 @@ def deleteOrder(state: State, embedder, seq_thresh=0.6):
                     break
 
     cart = [c for c in cart if c.quantity > 0]
-    return {"cart": cart, "rejected_items": rej_items}
+    return {"messages": new_messages, "cart": cart, "rejected_items": rej_items}
 
 
 
-def processOrder(state: State, menu_searcher, bm_searcher, vectordb, emb_thresh, seq_thresh):
+def processOrder(state: State, menu_searcher, bm_searcher, emb_thresh, seq_thresh):
     mro = state["most_recent_order"]
     cart = state["cart"]
     rej_items = []
@@ -326,13 +498,15 @@ def processOrder(state: State, menu_searcher, bm_searcher, vectordb, emb_thresh,
     new_messages = []
     # print(f"mro items - {mro.items}")
     # print(f"mro delete - {mro.delete}")
-    for item in mro.items:
+    # resolve every line of the order together (one embedding pass for the whole order)
+    with span("resolve", items=len(mro.items)):
+        results = menu_searcher.unify_many([item.item_name for item in mro.items], bm_searcher=bm_searcher, emb_thresh=emb_thresh, seq_thresh=seq_thresh)
+
+    for item, result in zip(mro.items, results):
         # pass something to internal for each of the 3 scenarios so you can make conditional edges for all 3 later.
         # print(type(mro), type(item), type(mro.model_dump_json()))
-        result = menu_searcher.unify(item.item_name, bm_searcher=bm_searcher, vectordb=vectordb, emb_thresh=emb_thresh, seq_thresh=seq_thresh)
-        
-        if result.get('exact', False):
-            # Exact match
+        if result.get('found', False):
+            # a cascade stage (exact/alias, fuzzy, bm25 or embedding) was certain
             cart.append(Item(item_name=result['item'], quantity=item.quantity, modifiers=item.modifiers))
         else:
             # no exact
@@ -341,8 +515,8 @@ def processOrder(state: State, menu_searcher, bm_searcher, vectordb, emb_thresh,
             # 2. multiple good matches -> ask for clarification
             # 3. no good matches -> reject, and show best alternative (maybe use metadata based retriever which will be used by menu query)
 
-            # certain match - 0.85 emb, 0.8 seq
-            # good match - 0.5 emb, 0.6 seq
+            # certain match - EMB_CERTAIN emb, 0.8 seq
+            # good match - EMB_GOOD emb, 0.6 seq
             # bad match - everything else
 
             # one certain match
@@ -352,7 +526,7 @@ def processOrder(state: State, menu_searcher, bm_searcher, vectordb, emb_thresh,
             # print(seq)
 
             certain_match_seq = [item for item, score in zip(seq["items"], seq["scores"]) if score >= 0.8]
-            certain_match_emb = [item for item, score in zip(emb["items"], emb["scores"]) if score >= 0.85]
+            certain_match_emb = [item for item, score in zip(emb["items"], emb["scores"]) if score >= EMB_CERTAIN]
 
             certain_set = set(certain_match_seq + certain_match_emb)
             if len(certain_set) == 1:
@@ -370,7 +544,7 @@ def processOrder(state: State, menu_searcher, bm_searcher, vectordb, emb_thresh,
             # no certains if code reaches here
             
             good_match_seq = [item for item, score in zip(seq["items"], seq["scores"]) if score >= 0.6]
-            good_match_emb = [item for item, score in zip(emb["items"], emb["scores"]) if score >= 0.5]
+            good_match_emb = [item for item, score in zip(emb["items"], emb["scores"]) if score >= EMB_GOOD]
             good_set = set(good_match_emb + good_match_seq)
 
             if len(good_set) != 0:
@@ -379,16 +553,11 @@ def processOrder(state: State, menu_searcher, bm_searcher, vectordb, emb_thresh,
                 new_messages.append(AIMessage(s))
                 continue
             else:
-                # bad. rejection logic.
-                similars = menu_searcher.embeddingSearch(item.item_name, vectordb=vectordb, emb_thresh=0)
-                # if not similars["found"]:
-                #     new_messages.append(AIMessage())
-
-                maxidx = np.argmax(similars["scores"])
-                rej_items.append((item.item_name, similars["items"][maxidx]))
+                # bad. rejection logic. closest item comes from the scores computed in unify_many
+                rej_items.append((item.item_name, result["closest"]))
 
     
-    print(f"Your cart is now {cart}")
+    logger.debug("cart is now %s", cart)
 
     return {
         "messages": new_messages,
@@ -0,0 +1,132 @@
+import re
+
+from Classes import Item, Order
+from menu_index import normalize_name
+
+# Local, grammar-based parser for simple orders ("one classic burger and an iced tea").
+# Anything it is not sure about returns None so extract_order_node falls back to orderChain.
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "a couple of": 2, "a pair of": 2,
+}
+
+ORDER_PREFIX = re.compile(
+    r"^(hi|hello|hey|please|ok|okay|so|and|also|then|now)?[\s,]*"
+    r"(i want|i'd like|i would like|i'll have|i will have|i'll take|i will take|can i get|can i have|"
+    r"could i get|could i have|may i have|give me|get me|bring me|i need|add|order)?\s*"
+    r"(to order|to have|to get)?\s*"
+)
+DELETE_PREFIX = re.compile(r"^(please\s+)?(remove|delete|cancel|drop|take off|take out)\s+(the\s+)?")
+MODIFY_WORDS = re.compile(r"\b(change|make it|make that|instead|replace|swap|modify|update)\b")
+SEGMENT_SPLIT = re.compile(r"\s*(?:,|;|&|\band\b|\bplus\b|\balso\b)\s*")
+QUANTITY = re.compile(r"^(\d+|" + "|".join(sorted(map(re.escape, NUMBER_WORDS), key=len, reverse=True)) + r")\s+")
+PORTION = re.compile(r"^(x\s+)?((servings?|plates?|orders?|bowls?|glass(es)?|cups?|portions?|pieces?)\s+of\s+)?(the\s+)?")
+MODIFIER_START = re.compile(r"\b(with|without|no|extra|less|more|light|hold the)\b")
+PLAIN_MODIFIER = re.compile(r"^(no|extra|less|more|light)\s+")
+TRAILING = re.compile(r"[\s.!]*(please|thanks|thank you)?[\s.!]*$")
+
+
+class OrderParser:
+    """
+    Recognizes quantities, menu names (via MenuIndex, aliases included) and modifier phrases
+    such as "no onions" / "extra cheese", and emits a Classes.Order (items/delete/modify).
+    parse() returns None whenever any part of the utterance is not understood.
+    """
+
+    def __init__(self, menu_index):
+        self.menu_index = menu_index
+
+    def _resolve(self, name):
+        canonical = self.menu_index.resolve(name)
+        if canonical is None and name.endswith("s"):
+            canonical = self.menu_index.resolve(name[:-1])
+        return canonical
+
+    @staticmethod
+    def _modifiers(text):
+        mods = []
+        for phrase in re.split(r"\s*(?:,|\band\b)\s*", text):
+            phrase = re.sub(r"^with\s+", "", phrase.strip())
+            phrase = re.sub(r"^(without|hold the)\s+", "no ", phrase)
+            if phrase:
+                mods.append(phrase)
+        return mods
+
+    def _modifier_clause(self, text):
+        """
+        (modifiers, items) for a clause like "with extra butter and 2 tandoori roti". A "with" phrase
+        that starts with a quantity or names a menu item is another order line, returned as its own
+        Item; if such a phrase does not parse cleanly the clause is None (leave it to the LLM).
+        """
+        modifiers, items = [], []
+        for phrase in self._modifiers(text):
+            if PLAIN_MODIFIER.match(phrase):
+                modifiers.append(phrase)
+            elif QUANTITY.match(phrase) or self._resolve(PORTION.sub("", phrase, count=1).strip()) is not None:
+                parsed = self._parse_segment(phrase)
+                if parsed is None:
+                    return None
+                items.extend(parsed)
+            else:
+                modifiers.append(phrase)
+        return modifiers, items
+
+    def _parse_segment(self, segment):
+        """[Item, ...] for "2 garlic naan with extra butter" (one Item per menu item named), or None."""
+        quantity = 1
+        m = QUANTITY.match(segment)
+        if m:
+            token = m.group(1)
+            quantity = int(token) if token.isdigit() else NUMBER_WORDS[token]
+            segment = segment[m.end():]
+        segment = PORTION.sub("", segment, count=1)
+
+        modifiers, extra = [], []
+        m = MODIFIER_START.search(segment)
+        if m and self._resolve(segment.strip()) is None:
+            clause = self._modifier_clause(segment[m.start():])
+            if clause is None:
+                return None
+            modifiers, extra = clause
+            segment = segment[:m.start()]
+
+        name = self._resolve(segment.strip())
+        if name is None or quantity <= 0:
+            return None
+        return [Item(item_name=name, quantity=quantity, modifiers=modifiers)] + extra
+
+    def parse(self, text):
+        text = normalize_name(text)
+        if not text or "?" in text or MODIFY_WORDS.search(text):
+            return None
+        text = TRAILING.sub("", text)
+
+        target = "items"
+        m = DELETE_PREFIX.match(text)
+        if m:
+            target = "delete"
+            text = text[m.end():]
+        else:
+            text = ORDER_PREFIX.sub("", text, count=1)
+
+        parsed = []
+        for segment in SEGMENT_SPLIT.split(text):
+            if not segment:
+                continue
+            if parsed and MODIFIER_START.match(segment):
+                # "... with extra cheese and no onions" -> the second half belongs to the previous item
+                clause = self._modifier_clause(segment)
+                if clause is None:
+                    return None
+                parsed[-1].modifiers.extend(clause[0])
+                parsed.extend(clause[1])
+                continue
+            items = self._parse_segment(segment)
+            if items is None:
+                return None
+            parsed.extend(items)
+
+        if not parsed:
+            return None
+        return Order(items=parsed if target == "items" else [], delete=parsed if target == "delete" else [], modify=[])
@@ -0,0 +1,133 @@
+import inspect
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from instrumentation import collect_counts, incr
+
+try:
+    from langchain_core.callbacks import get_usage_metadata_callback
+except ImportError: # older langchain_core: token usage is not collected
+    get_usage_metadata_callback = None
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Adds one to the llm_calls counter (instrumentation.incr) for every finished model call."""
+
+    def on_llm_end(self, response, **kwargs):
+        incr("llm_calls")
+
+
+# attached to every model call made while set, like get_usage_metadata_callback(); usage metadata
+# is summed per model name, so it cannot tell one call from three
+_llm_call_counter = ContextVar("profiler_llm_call_counter", default=None)
+register_configure_hook(_llm_call_counter, inheritable=True)
+
+
+@contextmanager
+def count_llm_calls():
+    token = _llm_call_counter.set(LLMCallCounter())
+    try:
+        yield
+    finally:
+        _llm_call_counter.reset(token)
+
+
+class NodeProfiler:
+    """
+    Opt-in per-node profiler for the LangGraph pipeline (makegraph(profile=...)).
+
+    Each wrapped node call records wall time, LLM tokens (usage metadata of every chat model
+    call made inside the node), DB round trips (statements on pooled connections) and embedding
+    calls. The last `window` calls per node are kept; stats() gives rolling p50/p95/p99.
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=window)) # node -> deque of records
+        self._lock = threading.Lock()
+
+    def wrap(self, name, fn):
+        """Returns fn(state) instrumented under the node name `name` (async nodes stay async)."""
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def aprofiled(state, *args, **kwargs):
+                usage = get_usage_metadata_callback() if get_usage_metadata_callback is not None else nullcontext()
+                start = time.perf_counter()
+                with collect_counts() as counts, count_llm_calls(), usage as usage_cb:
+                    try:
+                        return await fn(state, *args, **kwargs)
+                    finally:
+                        self._record(name, start, counts, usage_cb.usage_metadata if usage_cb is not None else {})
+            return aprofiled
+
+        @wraps(fn)
+        def profiled(state, *args, **kwargs):
+            usage = get_usage_metadata_callback() if get_usage_metadata_callback is not None else nullcontext()
+            start = time.perf_counter()
+            with collect_counts() as counts, count_llm_calls(), usage as usage_cb:
+                try:
+                    return fn(state, *args, **kwargs)
+                finally:
+                    self._record(name, start, counts, usage_cb.usage_metadata if usage_cb is not None else {})
+        return profiled
+
+    def _record(self, name, start, counts, tokens):
+        record = {
+            "node": name,
+            "ms": (time.perf_counter() - start) * 1000,
+            "input_tokens": sum(u.get("input_tokens", 0) for u in tokens.values()),
+            "output_tokens": sum(u.get("output_tokens", 0) for u in tokens.values()),
+            "llm_calls": counts.get("llm_calls", 0),
+            "db_round_trips": counts.get("db_round_trips", 0),
+            "embedding_calls": counts.get("embedding_calls", 0),
+            "embedding_model_calls": counts.get("embedding_model_calls", 0),
+            "ts": time.time(),
+        }
+        with self._lock:
+            self._samples[name].append(record)
+
+    def samples(self, node=None):
+        """Raw records, for one node or all of them (oldest first within a node)."""
+        with self._lock:
+            if node is not None:
+                return list(self._samples.get(node, ()))
+            return [r for records in self._samples.values() for r in records]
+
+    def stats(self):
+        """{node: {"calls", "p50_ms", "p95_ms", "p99_ms", "mean_ms", "tokens", "db_round_trips", "embedding_calls"}}."""
+        result = {}
+        with self._lock:
+            snapshot = {node: list(records) for node, records in self._samples.items()}
+        for node, records in snapshot.items():
+            if not records:
+                continue
+            ms = np.array([r["ms"] for r in records])
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            result[node] = {
+                "calls": len(records),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "mean_ms": float(ms.mean()),
+                # per-call averages over the window
+                "tokens": sum(r["input_tokens"] + r["output_tokens"] for r in records) / len(records),
+                "db_round_trips": sum(r["db_round_trips"] for r in records) / len(records),
+                "embedding_calls": sum(r["embedding_calls"] for r in records) / len(records),
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+# shared instance used by makegraph(profile=True)
+default_profiler = NodeProfiler()
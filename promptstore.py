@@ -133,4 +133,20 @@ routerPrompt = ChatPromptTemplate(
                 Output: extract
                 """),
     ("human", "{user_input}")
-    ])
\ No newline at end of file
+    ])
+
+
+# Single-call router + extractor (makegraph(combined_router=True)): the router's classification
+# rules and the order-taking rules in one prompt, answered with one RoutedOrder JSON object.
+routedOrderPrompt = ChatPromptTemplate.from_messages([
+    ("system", """
+You handle one customer message in two steps and answer with a single JSON object.
+
+STEP 1 - ROUTE. Classify the message with the rules below. Put the label ("extract" or
+"conversation") in the "intent" field instead of outputting it on its own.
+""" + routerPrompt.messages[0].prompt.template + """
+STEP 2 - ORDER. Only when the intent is "extract", fill the "order" field following the rules
+below; they describe the "order" object. When the intent is "conversation", set "order" to null.
+""" + orderPrompt.messages[0].prompt.template),
+    ("human", "{user_input}")
+])
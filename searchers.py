@@ -1,6 +1,230 @@
+import copy
+import re
 import numpy as np
-from utils import threshold_search
+from collections import Counter, defaultdict
 from difflib import SequenceMatcher
+from scipy import sparse
+from menu_index import MenuIndex, normalize_name
+from caching import LRUCache
+
+
+def normalize_rows(mat):
+    """L2-normalize each row of an embedding matrix (zero rows are left as zeros)."""
+    mat = np.asarray(mat, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat[None, :]
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def faiss_relevance_to_cosine(relevance):
+    """
+    Cosine similarity equivalent to a LangChain FAISS relevance score on normalized embeddings, for
+    carrying over thresholds tuned against the old vector store. FAISS returns the squared L2
+    distance (2 - 2cos) and LangChain scores it as 1 - distance / sqrt(2).
+    """
+    return 1 - (1 - relevance) / np.sqrt(2)
+
+
+# "certain" / "good" embedding tiers shared by the cascade and the order nodes, tuned as FAISS relevance
+EMB_CERTAIN = faiss_relevance_to_cosine(0.85)
+EMB_GOOD = faiss_relevance_to_cosine(0.5)
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores along the last axis, best first."""
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape[:-1] + (n,))
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(idx, order, axis=-1)
+
+def trigrams(text):
+    """Set of character trigrams of a string, padded so short words and word starts still index."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _CSRPostings:
+    """Read-only gram -> ids mapping over CSR arrays, so a loaded index needs no per-gram lists."""
+
+    def __init__(self, grams, indptr, indices):
+        self.rows = {g: r for r, g in enumerate(grams)}
+        self.indptr = indptr
+        self.indices = indices
+
+    def get(self, gram, default=()):
+        r = self.rows.get(gram)
+        if r is None:
+            return default
+        return self.indices[self.indptr[r]:self.indptr[r + 1]].tolist()
+
+    def __getitem__(self, gram):
+        return self.get(gram)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class TrigramIndex:
+    """
+    Character-trigram inverted index over lowercased menu names, stored as CSR postings.
+
+    search() counts, with one bincount over the postings of the query's trigrams, how many trigrams
+    each name shares with the query, shortlists the names whose overlap reaches the count implied
+    by the threshold, and runs SequenceMatcher.ratio() on the shortlist only, so scores and the
+    threshold keep their difflib meaning. The count asks for a trigram Dice coefficient of at least
+    threshold - dice_slack, i.e. shared >= (threshold - dice_slack) * (grams(query) + grams(name)) / 2.
+    A one-letter typo already costs up to three trigrams, so the slack is generous: on a 10k-item
+    synthetic menu with typo'd queries the shortlist keeps every match >= 0.8 and ~97% of those >= 0.6.
+    """
+
+    def __init__(self, strings, dice_slack=0.4):
+        postings = defaultdict(list)
+        for i, s in enumerate(strings):
+            for gram in trigrams(s):
+                postings[gram].append(i)
+        grams = sorted(postings)
+        indptr = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum([len(postings[g]) for g in grams], out=indptr[1:])
+        indices = np.fromiter((i for g in grams for i in postings[g]), dtype=np.int32, count=int(indptr[-1]))
+        self._init(strings, _CSRPostings(grams, indptr, indices), dice_slack)
+
+    def _init(self, strings, postings, dice_slack):
+        self.strings = list(strings)
+        self.postings = postings
+        self.dice_slack = dice_slack
+        # distinct trigrams per string
+        self.gram_counts = np.bincount(postings.indices, minlength=len(self.strings))
+
+    @classmethod
+    def from_arrays(cls, strings, grams, indptr, indices, dice_slack=0.4):
+        """Rebuild from to_arrays() output (e.g. memory-mapped from a compiled menu artifact)."""
+        index = cls.__new__(cls)
+        index._init(strings, _CSRPostings(grams, indptr, indices), dice_slack)
+        return index
+
+    def to_arrays(self):
+        """(grams, indptr, indices): the postings as CSR arrays, grams sorted."""
+        grams = sorted(self.postings.rows, key=self.postings.rows.get)
+        return grams, self.postings.indptr, self.postings.indices
+
+    def shared_counts(self, query_grams):
+        """Number of the given (distinct) trigrams each indexed string contains."""
+        p = self.postings
+        rows = [p.rows[g] for g in query_grams if g in p.rows]
+        if not rows:
+            return np.zeros(len(self.strings), dtype=np.int64)
+        ids = np.concatenate([p.indices[p.indptr[r]:p.indptr[r + 1]] for r in rows])
+        return np.bincount(ids, minlength=len(self.strings))
+
+    def shortlist(self, query, threshold):
+        """Ids (in menu order) of strings sharing enough trigrams with the query to be worth scoring at threshold."""
+        query_grams = trigrams(query)
+        need = np.ceil((threshold - self.dice_slack) * (len(query_grams) + self.gram_counts) / 2)
+        return np.flatnonzero(self.shared_counts(query_grams) >= np.maximum(need, 1)).tolist()
+
+    def search(self, query, threshold):
+        """[(id, ratio)] in menu order for shortlisted strings with SequenceMatcher ratio >= threshold."""
+        matcher = SequenceMatcher()
+        matcher.set_seq1(query) # query first, as the old full scan called SequenceMatcher(None, query, name)
+        hits = []
+        for i in self.shortlist(query, threshold):
+            matcher.set_seq2(self.strings[i])
+            # same cheap-bounds-first order as difflib.get_close_matches
+            if matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold:
+                similarity = matcher.ratio()
+                if similarity >= threshold:
+                    hits.append((i, similarity))
+        return hits
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens, used for both the BM25 corpus and queries."""
+    return re.findall(r"[a-z0-9]+", str(text).lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 (same formula and idf floor as rank_bm25.BM25Okapi) precomputed into a sparse
+    docs x terms weight matrix, so scoring a query is a single sparse dot product.
+    """
+
+    def __init__(self, corpus_tokens, k1=1.5, b=0.75, epsilon=0.25):
+        self.vocab = {}
+        rows, cols, tfs = [], [], []
+        for d, tokens in enumerate(corpus_tokens):
+            for term, tf in Counter(tokens).items():
+                rows.append(d)
+                cols.append(self.vocab.setdefault(term, len(self.vocab)))
+                tfs.append(tf)
+        rows, cols, tfs = np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), np.array(tfs, dtype=np.float64)
+
+        n_docs = len(corpus_tokens)
+        doc_len = np.array([len(tokens) for tokens in corpus_tokens], dtype=np.float64)
+        doc_freq = np.bincount(cols, minlength=len(self.vocab))
+        idf = np.log(n_docs - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        idf[idf < 0] = epsilon * idf.mean()
+
+        avgdl = doc_len.mean() if n_docs else 0.0
+        weights = idf[cols] * tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * doc_len[rows] / avgdl))
+        self.matrix = sparse.csr_matrix((weights, (rows, cols)), shape=(n_docs, len(self.vocab)))
+
+    @classmethod
+    def from_arrays(cls, terms, data, indices, indptr, shape):
+        """Rebuild from to_arrays() output without recomputing any weights."""
+        index = cls.__new__(cls)
+        index.vocab = {t: i for i, t in enumerate(terms)}
+        index.matrix = sparse.csr_matrix((data, indices, indptr), shape=tuple(shape), copy=False)
+        return index
+
+    def to_arrays(self):
+        """(terms in column order, data, indices, indptr, shape) of the weight matrix."""
+        terms = sorted(self.vocab, key=self.vocab.get)
+        m = self.matrix
+        return terms, m.data, m.indices, m.indptr, m.shape
+
+    @classmethod
+    def from_menu(cls, menu_df, columns=("item_name", "description", "ingredients"), **kwargs):
+        """Index the menu's name, description and ingredients columns (whichever exist)."""
+        columns = [c for c in columns if c in menu_df]
+        text = menu_df[columns].fillna("").astype(str).agg(" ".join, axis=1)
+        return cls([tokenize(t) for t in text], **kwargs)
+
+    def _query_matrix(self, token_lists):
+        rows, cols = [], []
+        for q, tokens in enumerate(token_lists):
+            for t in tokens:
+                if t in self.vocab:
+                    rows.append(q)
+                    cols.append(self.vocab[t])
+        data = np.ones(len(rows))
+        return sparse.csr_matrix((data, (cols, rows)), shape=(len(self.vocab), len(token_lists)))
+
+    def get_scores(self, tokens):
+        """BM25 score of every document for one tokenized query (rank_bm25 compatible)."""
+        return self.get_batch_scores([tokens])[0]
+
+    def get_batch_scores(self, token_lists):
+        """(queries x docs) BM25 scores for several tokenized queries with one sparse product."""
+        return (self.matrix @ self._query_matrix(token_lists)).T.toarray()
+
+
+DEFAULT_STAGES = ("exact", "seq", "bm", "emb")
+
+
+def _no_match(match_type):
+    return {"found": False, "items": [], "scores": [], "match_type": match_type}
+
 
 class MultiSearch:
 
@@ -8,46 +232,75 @@ class MultiSearch:
     # semantic matching -> vector db
     # rerank with sentence transformer
 
-    def __init__(self, df, bm_thresh):
+    def __init__(self, df, bm_thresh, embedder=None, k=10, menu_index=None, stages=DEFAULT_STAGES,
+                 seq_certain=0.8, bm_certain=0.9, emb_certain=EMB_CERTAIN, resolution_cache=None,
+                 menu_embeddings=None, trigram_index=None):
         self.menu_df = df
         self.menu_df['item_name_lower'] = self.menu_df['item_name'].str.lower()
         self.menu_items = self.menu_df['item_name_lower'].tolist()
+        self.menu_names = self.menu_df['item_name'].tolist()
         self.bm_thresh = bm_thresh
+        self.k = k
+        self.menu_index = menu_index if menu_index is not None else MenuIndex(df)
+        self.trigram_index = trigram_index if trigram_index is not None else TrigramIndex(self.menu_items)
+
+        # matching cascade for unify: stages run in order, each only on lines still undecided
+        unknown = set(stages) - set(DEFAULT_STAGES)
+        if unknown:
+            raise ValueError(f"Unknown matching stages: {sorted(unknown)}")
+        self.stages = tuple(stages)
+        self.seq_certain = seq_certain
+        self.bm_certain = bm_certain
+        self.emb_certain = emb_certain
+        # resolved queries, keyed on (normalized query, menu version, thresholds)
+        self.resolution_cache = resolution_cache if resolution_cache is not None else LRUCache(maxsize=4096, ttl=6 * 3600)
+
+        # static, L2-normalized menu-name embeddings -> cosine similarity is a single matmul
+        self.embedder = embedder
+        # (a compiled menu artifact passes them in precomputed and memory-mapped)
+        self.menu_embeddings = menu_embeddings
+        if menu_embeddings is None and embedder is not None:
+            self.menu_embeddings = normalize_rows(embedder.embed_documents(self.menu_names))
     
     def find_exact_match(self, item_name: str) -> dict:
-        """Find exact match for item in menu"""
-        item_lower = item_name.lower().strip()
-        match = self.menu_df[self.menu_df['item_name_lower'] == item_lower]
+        """Find exact (or alias) match for item in menu"""
+        match = self.menu_index.lookup(item_name)
         
-        if not match.empty:
+        if match['found']:
             return {
                 'found': True,
-                'items': match.iloc[0]['item_name'],
-                'match_type': 'exact'
+                'items': match['item'],
+                'match_type': match['match_type']
             }
         return {'found': False}
     
     def bm25_search(self, item_name, bm_searcher):
         """Use BM25 Okapi algorithm and return results above some threshold (post-softmax)."""
 
-        tkns = item_name.lower().split(" ")
+        tkns = tokenize(item_name)
         doc_scores = bm_searcher.get_scores(tkns)
-        
-        # softmax
-        e = np.exp(doc_scores)
-        doc_scores = e/sum(e)
+        return self._bm25_result(doc_scores)
+
+    def _bm25_result(self, doc_scores):
+        if doc_scores is None or not np.any(doc_scores):
+            # no bm25 index, or no query term is in the menu vocabulary
+            res, scores = self.menu_df.iloc[[]], []
+        else:
+            # softmax (shifted by the max for numerical stability, same probabilities)
+            e = np.exp(doc_scores - np.max(doc_scores))
+            doc_scores = e/sum(e)
 
-        # threshold
-        res = self.menu_df.iloc[np.where(doc_scores > self.bm_thresh)]
-        scores = doc_scores[np.where(doc_scores > self.bm_thresh)]
+            # threshold
+            res = self.menu_df.iloc[np.where(doc_scores > self.bm_thresh)]
+            scores = doc_scores[np.where(doc_scores > self.bm_thresh)]
 
         assert len(res) == len(scores)
 
         if not res.empty:
             return {
                 'found': True,
-                'items': res["item_name"],
-                'scores': scores,
+                'items': res["item_name"].tolist(),
+                'scores': list(scores),
                 'match_type': "bm"
             }
         else:
@@ -59,16 +312,9 @@ class MultiSearch:
         
     def sequenceMatch(self, item_name, seq_threshold):
         item_lower = item_name.lower().strip()
-        res = []
-        scores = []
-        
-        for _, row in self.menu_df.iterrows():
-            menu_item = row['item_name_lower']
-            similarity = SequenceMatcher(None, item_lower, menu_item).ratio()
-            
-            if similarity >= seq_threshold:
-                res.append(row['item_name'])
-                scores.append(similarity)
+        hits = self.trigram_index.search(item_lower, seq_threshold)
+        res = [self.menu_names[i] for i, _ in hits]
+        scores = [similarity for _, similarity in hits]
 
         if res:
             return {
@@ -85,14 +331,21 @@ class MultiSearch:
             }
         
     
-    def embeddingSearch(self, item_name, vectordb, emb_thresh):
-        # using vectorstore (FAISS)
-        res, scores = threshold_search(item_name.lower(), vectorstore=vectordb, emb_thresh=emb_thresh)
-        if res:
+    def embed_queries(self, names):
+        """Embed a batch of queries in one forward pass and L2-normalize them."""
+        names = [n.lower() for n in names]
+        # CachedEmbeddings keeps one-off queries in memory instead of persisting them as documents
+        embed = getattr(self.embedder, "embed_queries", self.embedder.embed_documents)
+        return normalize_rows(embed(names))
+
+    def _embedding_result(self, scores, emb_thresh, k):
+        idx = top_k(scores, k)
+        idx = idx[scores[idx] >= emb_thresh]
+        if len(idx):
             return {
                 'found': True,
-                'items': res,
-                'scores': scores,
+                'items': [self.menu_names[i] for i in idx],
+                'scores': scores[idx].tolist(),
                 'match_type': "emb"
             }
         else:
@@ -102,54 +355,145 @@ class MultiSearch:
                     "match_type": "emb"
             }
 
-    def unify(self, query, bm_searcher, vectordb, emb_thresh, seq_thresh):
-        exact = self.find_exact_match(query)
-        # bm = self.bm25_search(query, bm_searcher)
-        emb = self.embeddingSearch(query, vectordb, emb_thresh)
-        seq = self.sequenceMatch(query, seq_thresh)
+    def embeddingSearch(self, item_name, emb_thresh, k=None):
+        """Cosine similarity of one query against the precomputed menu matrix, top-k above emb_thresh."""
+        return self.embeddingSearchBatch([item_name], emb_thresh, k)[0]
+
+    def embeddingSearchBatch(self, item_names, emb_thresh, k=None, query_embs=None):
+        """Score a batch of queries with a single matrix multiply (queries x menu)."""
+        if not item_names:
+            return []
+        if query_embs is None:
+            query_embs = self.embed_queries(item_names)
+        sims = query_embs @ self.menu_embeddings.T
+        return [self._embedding_result(row, emb_thresh, k or self.k) for row in sims]
+
+    def unify(self, query, bm_searcher, emb_thresh, seq_thresh):
+        return self.unify_many([query], bm_searcher, emb_thresh, seq_thresh)[0]
+
+    def unify_many(self, queries, bm_searcher, emb_thresh, seq_thresh):
+        """
+        Resolve a batch of order lines with a tiered cascade (self.stages, cheapest first).
+        Each stage only sees the lines no earlier stage was certain about, so exact orders never
+        touch the fuzzy, BM25 or embedding stages. Batched stages (bm, emb) score all their lines at once.
+
+        Returns one dict per query:
+          decided   -> {"found": True, "exact": bool, "item": name, "stage": "exact"|"alias"|"seq"|"bm"|"emb"}
+          undecided -> {"found": False, "exact": False, "stage": None, "seq": .., "bm": .., "emb": .., "closest": name}
+        """
+        results = [None] * len(queries)
+        evidence = [{"seq": _no_match("seq"), "bm": _no_match("bm"), "emb": _no_match("emb"), "closest": None}
+                    for _ in queries]
+
+        # hot phrasings come straight from the cache; the menu version in the key drops stale entries
+        keys = [(normalize_name(q), self.menu_index.version, bm_searcher is not None, emb_thresh, seq_thresh) for q in queries]
+        pending = []
+        for i, key in enumerate(keys):
+            cached = self.resolution_cache.get(key)
+            if cached is not None:
+                results[i] = copy.deepcopy(cached)
+            else:
+                pending.append(i)
+        missed = list(pending)
+
+        for stage in self.stages:
+            if not pending:
+                break
+            stage_fn = getattr(self, f"_stage_{stage}")
+            decided = stage_fn(queries, pending, evidence, bm_searcher=bm_searcher, emb_thresh=emb_thresh, seq_thresh=seq_thresh)
+            for i, (item, label) in decided.items():
+                results[i] = {"found": True, "exact": stage == "exact", "item": item, "stage": label}
+            pending = [i for i in pending if i not in decided]
+
+        for i in pending:
+            ev = evidence[i]
+            if ev["closest"] is None:
+                # no embedding stage ran -> best lexical candidate as the suggestion
+                for key in ("bm", "seq"):
+                    if ev[key]["found"]:
+                        ev["closest"] = ev[key]["items"][int(np.argmax(ev[key]["scores"]))]
+                        break
+            results[i] = {"found": False, "exact": False, "stage": None, **ev}
+
+        for i in missed:
+            self.resolution_cache.put(keys[i], copy.deepcopy(results[i]))
 
-        # check for exact first and exit if found
-        if exact["found"]:
-            return {"exact": True, "item": exact["items"]}
-        else:
-            # if seq["found"]:
-            #     print(seq["items"])
-            #     print(seq["scores"])
-            # else:
-            #     print("no seq")
-            # if emb["found"]:
-            #     print(emb["items"])
-            #     print(emb["scores"])
-            # else:
-            #     print("no emb")
-
-            # print("no exact")
-            return {"exact": False, "seq": seq, "emb": emb}
-        
         # 3 scenarios
         # 1. one very good match -> add directly to cart
         # 2. multiple good matches -> ask for clarification
         # 3. no good matches -> reject, and show best alternative (maybe use metadata based retriever which will be used by menu query)
-        
+        return results
+
+    def _stage_exact(self, queries, pending, evidence, **_):
+        decided = {}
+        for i in pending:
+            exact = self.find_exact_match(queries[i])
+            if exact["found"]:
+                decided[i] = (exact["items"], exact["match_type"])
+        return decided
+
+    def _stage_seq(self, queries, pending, evidence, seq_thresh, **_):
+        # certain only if exactly one name clears the "certain" fuzzy score
+        decided = {}
+        for i in pending:
+            seq = evidence[i]["seq"] = self.sequenceMatch(queries[i], seq_thresh)
+            certain = [n for n, s in zip(seq["items"], seq["scores"]) if s >= self.seq_certain]
+            if len(certain) == 1:
+                decided[i] = (certain[0], "seq")
+        return decided
+
+    def _stage_bm(self, queries, pending, evidence, bm_searcher, **_):
+        # certain if one document dominates the softmax and the fuzzy stage agrees on it
+        if bm_searcher is None:
+            return {}
+        decided = {}
+        bm_scores = bm_searcher.get_batch_scores([tokenize(queries[i]) for i in pending])
+        for i, row in zip(pending, bm_scores):
+            bm = evidence[i]["bm"] = self._bm25_result(row)
+            if not bm["found"]:
+                continue
+            best = int(np.argmax(bm["scores"]))
+            if bm["scores"][best] >= self.bm_certain and bm["items"][best] in evidence[i]["seq"]["items"]:
+                decided[i] = (bm["items"][best], "bm")
+        return decided
+
+    def _stage_emb(self, queries, pending, evidence, emb_thresh, **_):
+        # same rule processOrder always used: exactly one name among certain fuzzy + certain embedding hits
+        if self.menu_embeddings is None:
+            return {}
+        decided = {}
+        sims = self.embed_queries([queries[i] for i in pending]) @ self.menu_embeddings.T
+        for i, row in zip(pending, sims):
+            ev = evidence[i]
+            emb = ev["emb"] = self._embedding_result(row, emb_thresh, self.k)
+            ev["closest"] = self.menu_names[int(np.argmax(row))]
+            certain = {n for n, s in zip(ev["seq"]["items"], ev["seq"]["scores"]) if s >= self.seq_certain}
+            certain.update(n for n, s in zip(emb["items"], emb["scores"]) if s >= self.emb_certain)
+            if len(certain) == 1:
+                decided[i] = (certain.pop(), "emb")
+        return decided
+
 
 class MenuValidator:
-    def __init__(self, menu_df):
+    def __init__(self, menu_df, menu_index=None, trigram_index=None):
         self.menu_df = menu_df
         # Create lowercase version for matching
         self.menu_df['item_name_lower'] = self.menu_df['item_name'].str.lower()
         self.menu_items = self.menu_df['item_name_lower'].tolist()
+        self.menu_index = menu_index if menu_index is not None else MenuIndex(menu_df)
+        # pass MultiSearch.trigram_index to share one index over the same menu
+        self.trigram_index = trigram_index if trigram_index is not None else TrigramIndex(self.menu_items)
     
     def find_exact_match(self, item_name: str) -> dict:
-        """Find exact match for item in menu"""
-        item_lower = item_name.lower().strip()
-        match = self.menu_df[self.menu_df['item_name_lower'] == item_lower]
+        """Find exact (or alias) match for item in menu"""
+        match = self.menu_index.lookup(item_name)
         
-        if not match.empty:
+        if match['found']:
             return {
                 'found': True,
-                'item': match.iloc[0]['item_name'],
-                'price': match.iloc[0]['price'],
-                'match_type': 'exact'
+                'item': match['item'],
+                'price': match['price'],
+                'match_type': match['match_type']
             }
         return {'found': False}
     
@@ -174,16 +518,13 @@ class MenuValidator:
         item_lower = item_name.lower().strip()
         similar_items = []
         
-        for _, row in self.menu_df.iterrows():
-            menu_item = row['item_name_lower']
-            similarity = SequenceMatcher(None, item_lower, menu_item).ratio()
-            
-            if similarity >= threshold:
-                similar_items.append({
-                    'item': row['item_name'],
-                    'price': row['price'],
-                    'similarity': similarity
-                })
+        for i, similarity in self.trigram_index.search(item_lower, threshold):
+            row = self.menu_df.iloc[i]
+            similar_items.append({
+                'item': row['item_name'],
+                'price': row['price'],
+                'similarity': similarity
+            })
         
         # Sort by similarity (highest first)
         similar_items.sort(key=lambda x: x['similarity'], reverse=True)
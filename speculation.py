@@ -0,0 +1,56 @@
+import contextvars
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# shared pool for speculative extraction calls made by the sync graph
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SPECULATE_WORKERS", "8")), thread_name_prefix="speculate")
+
+
+def submit(fn, *args, **kwargs):
+    """Run fn on the speculation pool in a copy of the caller's context (profiler counters, usage callbacks)."""
+    return _executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class SpeculationGuard:
+    """
+    Cost guard for speculative order extraction (makegraph(speculative=...)).
+
+    Running orderChain alongside routerChain saves a round trip on order turns but spends an
+    extraction call on every conversation turn. The guard keeps the outcome of the last `window`
+    LLM-routed turns and only speculates while the share routed to "extract" is at least
+    `min_hit_rate`, i.e. while at most 1 - min_hit_rate of speculative calls can be thrown away.
+    Inputs longer than `max_input_chars` (expensive prompts) are never speculated on.
+    """
+
+    def __init__(self, min_hit_rate=None, window=50, max_input_chars=None, enabled=True):
+        self.min_hit_rate = float(os.getenv("SPECULATE_MIN_HIT_RATE", "0.3")) if min_hit_rate is None else min_hit_rate
+        self.max_input_chars = int(os.getenv("SPECULATE_MAX_CHARS", "500")) if max_input_chars is None else max_input_chars
+        self.enabled = enabled
+        self.outcomes = deque(maxlen=window) # True: the router said "extract"
+        self.speculated = 0
+        self.wasted = 0 # speculative extractions cancelled or discarded
+        self._lock = threading.Lock()
+
+    def hit_rate(self):
+        with self._lock:
+            return sum(self.outcomes) / len(self.outcomes) if self.outcomes else None
+
+    def should_speculate(self, user_input):
+        if not self.enabled or len(user_input) > self.max_input_chars:
+            return False
+        rate = self.hit_rate()
+        # optimistic until there is some history to go on
+        return rate is None or len(self.outcomes) < 5 or rate >= self.min_hit_rate
+
+    def record(self, label, speculated):
+        with self._lock:
+            self.outcomes.append(label == "extract")
+            if speculated:
+                self.speculated += 1
+                if label != "extract":
+                    self.wasted += 1
+
+    def stats(self):
+        return {"speculated": self.speculated, "wasted": self.wasted, "hit_rate": self.hit_rate()}
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import logger
+
+
+class Resources:
+    """
+    Named, lazily built singletons (menu, LLM client, embedder, indexes, DB-backed caches).
+
+    Factories take the Resources object and pull their dependencies with get(), so each resource
+    is built exactly once, on first use, no matter which thread asks first. warmup() builds the
+    rest on a thread pool (dependencies are waited for, independent resources load in parallel),
+    and timings() gives the startup breakdown.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._values = {}
+        self._locks = {}
+        self._timings = {}
+        self._created = time.perf_counter()
+
+    def register(self, name, factory):
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+
+    def resource(self, name):
+        """Decorator form of register()."""
+        def decorator(factory):
+            self.register(name, factory)
+            return factory
+        return decorator
+
+    def __contains__(self, name):
+        return name in self._factories
+
+    def names(self):
+        return list(self._factories)
+
+    def is_built(self, name):
+        return name in self._values
+
+    def get(self, name):
+        if name in self._values:
+            return self._values[name]
+        with self._locks[name]:
+            if name not in self._values:
+                start = time.perf_counter()
+                value = self._factories[name](self)
+                end = time.perf_counter()
+                # seconds includes time spent waiting for dependencies built by other threads
+                self._timings[name] = {"started_at": start - self._created, "seconds": end - start}
+                self._values[name] = value
+        return self._values[name]
+
+    async def aget(self, name):
+        """get() for async callers: a resource still being built is waited for on a worker thread."""
+        if name in self._values:
+            return self._values[name]
+        return await asyncio.to_thread(self.get, name)
+
+    def warmup(self, names=None, max_workers=4, wait=True):
+        """Build `names` (default: everything) concurrently. With wait=False, returns immediately."""
+        names = [n for n in (names or self._factories) if not self.is_built(n)]
+        if not names:
+            return
+        pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        futures = [pool.submit(self.get, n) for n in names]
+
+        def finish():
+            for name, future in zip(names, futures):
+                error = future.exception()
+                if error is not None:
+                    logger.error("startup: building %s failed: %s", name, error)
+            logger.info("startup finished:\n%s", self.report())
+
+        if wait:
+            pool.shutdown(wait=True)
+            finish()
+        else:
+            pool.shutdown(wait=False)
+            threading.Thread(target=finish, name="startup-report", daemon=True).start()
+
+    def timings(self):
+        """{name: {"started_at", "seconds"}} for every resource built so far (seconds since creation)."""
+        return dict(self._timings)
+
+    def report(self):
+        rows = sorted(self._timings.items(), key=lambda kv: kv[1]["started_at"])
+        total = max((t["started_at"] + t["seconds"] for _, t in rows), default=0.0)
+        lines = [f"  {name:<20} +{t['started_at']:7.2f} s  {t['seconds']:7.2f} s" for name, t in rows]
+        return "\n".join(lines + [f"  {'ready after':<20}  {total:7.2f} s"])
@@ -0,0 +1,139 @@
+"""
+pytest-benchmark versions of the hot paths in benchmarks/micro_benchmarks.py, with per-call budgets.
+
+    python -m pytest tests/test_benchmarks.py                      # timings + budget checks
+    python -m pytest tests/test_benchmarks.py --benchmark-disable  # run each path once, no timing
+
+Budgets are median ms per call on a BENCH_MENU_SIZE-item synthetic menu (default 10k), set at
+several times the current numbers: they catch an accidental O(n) scan, not a 10% slowdown. For
+before/after numbers across menu sizes use `python benchmarks/micro_benchmarks.py`.
+"""
+import os
+import random
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from availability import AvailabilityEngine
+from benchmarks.micro_benchmarks import fuzzy_target, sqlite_restaurant, synthetic_menu, typo
+from Classes import Item, Order, OrderUpdate
+from db_utils import get_unavailable_meals
+from menu_index import MenuIndex
+from nodes import deleteOrder, modifyOrder
+from searchers import BM25Index, MenuValidator, MultiSearch, faiss_relevance_to_cosine
+
+MENU_SIZE = int(os.getenv("BENCH_MENU_SIZE", "10000"))
+CART_SIZE = 50
+
+BUDGET_MS = {
+    "unify_exact": 1,
+    "unify_typo": 60,
+    "unify_unknown": 60,
+    "trigram_search": 60,
+    "validate_item_typo": 300,
+    "delete_order_typo": 10,
+    "modify_order_typo": 10,
+    "count_ordered_items": 20,
+    "unavailable_meals": 5,
+}
+
+
+@pytest.fixture(scope="module")
+def world():
+    rng = random.Random(MENU_SIZE)
+    menu = synthetic_menu(MENU_SIZE)
+    embedder = DeterministicFakeEmbedding(size=384)
+    menu_index = MenuIndex(menu)
+    searcher = MultiSearch(menu.copy(), bm_thresh=0.01, embedder=embedder, menu_index=menu_index)
+    names = menu["item_name"].tolist()
+    cart = [Item(item_name=name, quantity=1) for name in rng.sample(names, CART_SIZE)]
+    conn = sqlite_restaurant(menu)
+    return {
+        "menu": menu,
+        "embedder": embedder,
+        "menu_index": menu_index,
+        "searcher": searcher,
+        "bm_searcher": BM25Index.from_menu(menu),
+        "validator": MenuValidator(menu.copy(), menu_index=menu_index, trigram_index=searcher.trigram_index),
+        "exact": rng.choice(names),
+        "misspelt": typo(rng.choice(names), rng),
+        "cart": cart,
+        "cart_typo": fuzzy_target([c.item_name for c in cart], rng),
+        "conn": conn,
+        "engine": AvailabilityEngine.from_db(conn, max_age=None),
+    }
+
+
+def within_budget(benchmark, case):
+    if benchmark.stats is None: # --benchmark-disable
+        return True
+    return benchmark.stats.stats.median * 1000 <= BUDGET_MS[case]
+
+
+def unify(world, query):
+    def call():
+        world["searcher"].resolution_cache.clear()
+        return world["searcher"].unify(query, world["bm_searcher"], emb_thresh=faiss_relevance_to_cosine(0.5), seq_thresh=0.5)
+    return call
+
+
+def test_unify_exact(benchmark, world):
+    benchmark(unify(world, world["exact"]))
+    assert within_budget(benchmark, "unify_exact")
+
+
+def test_unify_typo(benchmark, world):
+    benchmark(unify(world, world["misspelt"]))
+    assert within_budget(benchmark, "unify_typo")
+
+
+def test_unify_unknown(benchmark, world):
+    benchmark(unify(world, "deep fried unicorn steak"))
+    assert within_budget(benchmark, "unify_unknown")
+
+
+def test_trigram_search(benchmark, world):
+    hits = benchmark(world["searcher"].trigram_index.search, world["misspelt"].lower(), 0.5)
+    assert hits
+    assert within_budget(benchmark, "trigram_search")
+
+
+def test_validate_item_typo(benchmark, world):
+    benchmark(world["validator"].validate_item, world["misspelt"])
+    assert within_budget(benchmark, "validate_item_typo")
+
+
+def test_delete_order_typo(benchmark, world):
+    def call():
+        state = {"cart": [c.model_copy() for c in world["cart"]],
+                 "most_recent_order": Order(items=[], delete=[Item(item_name=world["cart_typo"], quantity=1)], modify=[])}
+        return deleteOrder(state, world["embedder"], 0.6, world["menu_index"])
+
+    result = benchmark(call)
+    assert len(result["cart"]) == CART_SIZE - 1
+    assert within_budget(benchmark, "delete_order_typo")
+
+
+def test_modify_order_typo(benchmark, world):
+    def call():
+        state = {"cart": [c.model_copy() for c in world["cart"]],
+                 "most_recent_order": Order(items=[], delete=[], modify=[Item(item_name=world["cart_typo"], quantity=2)])}
+        return modifyOrder(state, world["embedder"], 0.6, world["menu_index"])
+
+    result = benchmark(call)
+    assert sum(c.quantity for c in result["cart"]) == CART_SIZE + 1
+    assert within_budget(benchmark, "modify_order_typo")
+
+
+def test_count_ordered_items(benchmark, world):
+    order = Order(items=world["cart"], delete=[], modify=[])
+    benchmark(OrderUpdate().count_ordered_items, order, world["menu"])
+    assert within_budget(benchmark, "count_ordered_items")
+
+
+def test_unavailable_meals_from_engine(benchmark, world):
+    benchmark(get_unavailable_meals, world["conn"], world["engine"])
+    assert within_budget(benchmark, "unavailable_meals")
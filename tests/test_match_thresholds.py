@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from Classes import Item, Order
+from nodes import processOrder
+from searchers import MultiSearch, faiss_relevance_to_cosine
+
+MENU = pd.DataFrame({"meal_id": [1, 2], "item_name": ["Paneer Tikka", "Veg Burger"], "price": [250, 180]})
+QUERY = "cottage cheese skewers" # no lexical overlap: only the embedding stage can match it
+
+
+class FixedEmbeddings(Embeddings):
+    """Menu names on orthogonal axes; QUERY at a chosen cosine from Paneer Tikka."""
+
+    def __init__(self, cosine):
+        self.vectors = {"Paneer Tikka": [1.0, 0.0, 0.0], "Veg Burger": [0.0, 0.0, 1.0],
+                        QUERY: [cosine, float(np.sqrt(1 - cosine ** 2)), 0.0]}
+
+    def embed_documents(self, texts):
+        return [self.vectors[t] for t in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+# FAISS relevance of the near miss -> what the bot did before scores moved to raw cosine
+@pytest.mark.parametrize("relevance, outcome", [(0.9, "accept"), (0.8, "clarify"), (0.4, "reject")])
+def test_near_miss_keeps_baseline_outcome(relevance, outcome):
+    searcher = MultiSearch(MENU.copy(), bm_thresh=0.01, embedder=FixedEmbeddings(faiss_relevance_to_cosine(relevance)))
+    state = {"cart": [], "most_recent_order": Order(items=[Item(item_name=QUERY, quantity=1)], delete=[], modify=[])}
+
+    result = processOrder(state, searcher, None, emb_thresh=faiss_relevance_to_cosine(0.5), seq_thresh=0.5)
+
+    got = "accept" if result["cart"] else "clarify" if result["messages"] else "reject"
+    assert got == outcome
+    if outcome == "accept":
+        assert result["cart"][0].item_name == "Paneer Tikka"
+    if outcome == "reject":
+        assert result["rejected_items"] == [(QUERY, "Paneer Tikka")]
@@ -0,0 +1,35 @@
+import asyncio
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.stub_llm import StubChatModel
+from profiler import NodeProfiler
+
+
+def test_counts_every_llm_call_in_a_node():
+    llm = StubChatModel()
+    profiler = NodeProfiler()
+
+    def node(state):
+        for _ in range(3):
+            llm.invoke([HumanMessage("what's on the menu?")])
+        return {}
+
+    profiler.wrap("menu_query", node)({})
+
+    [record] = profiler.samples("menu_query")
+    assert record["llm_calls"] == 3
+    assert record["output_tokens"] == 3 * len("Here is what we have on the menu today.".split())
+
+
+def test_counts_llm_calls_in_async_nodes():
+    llm = StubChatModel()
+    profiler = NodeProfiler()
+
+    async def node(state):
+        await asyncio.gather(*(llm.ainvoke([HumanMessage("hi")]) for _ in range(2)))
+        return {}
+
+    asyncio.run(profiler.wrap("conversation", node)({}))
+
+    assert profiler.samples("conversation")[0]["llm_calls"] == 2
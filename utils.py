@@ -2,14 +2,23 @@ from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.schema import Document
 
-def makeRetriever(menu, search_type="similarity", k=10):    
-    docs = [
+def menu_documents(menu):
+    return [
         Document(page_content=f"{menu.iloc[i]['item_name']} - ₹{menu.iloc[i]['price']} ({menu.iloc[i]['category']} | {menu.iloc[i]['vegetarian']} | {menu.iloc[i]['description']} | {menu.iloc[i]['type']} | {menu.iloc[i]['cuisine']} | {menu.iloc[i]['ingredients']})", metadata={"index":i})
         for i in range(len(menu))
     ]
 
-    embedder = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    db = FAISS.from_documents(docs, embedder)
+def makeRetriever(menu, search_type="similarity", k=10, embedder=None, doc_embeddings=None):
+    """doc_embeddings: precomputed vectors for menu_documents(menu) (compiled menu artifact), skips embedding the menu."""
+    docs = menu_documents(menu)
+
+    if embedder is None:
+        embedder = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    if doc_embeddings is not None:
+        pairs = [(d.page_content, list(map(float, v))) for d, v in zip(docs, doc_embeddings)]
+        db = FAISS.from_embeddings(pairs, embedder, metadatas=[d.metadata for d in docs])
+    else:
+        db = FAISS.from_documents(docs, embedder)
     retriever = db.as_retriever(search_type=search_type, search_kwargs={"k": k})
     return retriever
 